@@ -1,13 +1,21 @@
 # app/handlers/base.py
+import functools
 import os
+import time
 
 import jwt
+from tornado.iostream import StreamClosedError
 from tornado.web import RequestHandler, HTTPError
+from tortoise.exceptions import IntegrityError
 
 from dotenv import load_dotenv
 import logging
 
 from app.models import User
+from app.service.auth_cache import auth_cache
+from app.service.metrics import METRICS_ENABLED, metrics, start_timings
+from app.service.response_cache import response_cache
+from app.service.serialization import JSON_CONTENT_TYPE, encode_json, negotiate
 
 # configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,48 +30,202 @@ if not SECRET_KEY:
     logging.warning("WARNING: Using auto-generated SECRET_KEY for dev only!")
 
 
-class BaseAuthHandler(RequestHandler):
+class Principal:
+    """The authenticated caller as described by the JWT claims, built without touching the DB"""
+    __slots__ = ("id", "username")
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+
+def rejects_deleted_user(method):
+    """Decorator for the write methods of handlers with load_user = False. The user of a valid token may have
+    been deleted by another process since (the auth cache only sees the deletes of this one): the write then
+    fails its foreign key check, answer 401 instead of 500."""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        try:
+            return await method(self, *args, **kwargs)
+        except IntegrityError:
+            await self.reject_deleted_user()
+            raise
+    return wrapper
+
+
+class BaseHandler(RequestHandler):
+    """Base of every handler: responses encoded in the negotiated format, JSON errors and request metrics"""
+
+    timings = None  # Timings of the request when metrics are on
+
+    async def prepare(self):
+        if METRICS_ENABLED:
+            self.timings = start_timings()
+
+    @property
+    def response_format(self):
+        """(content type, encoder) negotiated from the Accept header, see app/service/serialization.py"""
+        if not hasattr(self, "_response_format"):
+            self._response_format = negotiate(self.request.headers.get("Accept"))
+        return self._response_format
+
+    def write(self, chunk):
+        """Like RequestHandler.write, but dicts are encoded in the negotiated format with the fast encoders"""
+        if isinstance(chunk, dict):
+            content_type, encode = self.response_format
+            self.set_header("Content-Type", content_type)
+            self.set_header("Vary", "Accept")
+            chunk = self.timed_encode(encode, chunk)
+        super().write(chunk)
+
+    def timed_encode(self, encode, data):
+        """Call an encoder, timed as the serialization of the request"""
+        if self.timings is None:
+            return encode(data)
+        start = time.perf_counter()
+        body = encode(data)
+        self.timings.serialize += time.perf_counter() - start
+        return body
+
+    def finish(self, chunk=None):
+        if chunk is not None:
+            self.write(chunk)  # encoded before the timings are read
+            chunk = None
+        if self.timings is not None:
+            self.set_header("Server-Timing", self.timings.server_timing(self.request.request_time()))
+        return super().finish(chunk)
+
+    def on_finish(self):
+        if METRICS_ENABLED:
+            # any method name can be sent (and gets a 405), keep the label values bounded
+            method = self.request.method if self.request.method in self.SUPPORTED_METHODS else "other"
+            metrics.record(type(self).__name__, method, self.get_status(), self.request.request_time(), self.timings)
+
+    def write_error(self, status_code, **kwargs):
+        """Return errors in the negotiated format (JSON by default) instead of HTML"""
+        if "exc_info" in kwargs:
+            exc = kwargs["exc_info"][1]
+            self.finish({"error": str(exc)})
+        else:
+            self.finish({"error": self._reason})
+
+
+class BaseAuthHandler(BaseHandler):
     """Base handler with JWT auth and automatic user fetching"""
 
+    # Load the full User row before the handler runs. Handlers that only need the caller's id/username
+    # set this to False: current_user is then a Principal and load_current_user() fetches the User on demand.
+    load_user = True
+
     async def prepare(self):
-        """Called before every request; decodes JWT and sets self.current_user_obj"""
+        await super().prepare()
+        start = time.perf_counter()
+        await self.authenticate()
+        if self.timings is not None:
+            self.timings.auth += time.perf_counter() - start
+
+    async def authenticate(self):
+        """Called before every request; decodes JWT and sets self.principal (and self.current_user_obj if load_user)"""
+        self.principal = None  # default
         self.current_user_obj = None  # default
+        self._token = None
 
         auth = self.request.headers.get("Authorization")
 
         if not auth or not auth.startswith("Bearer "):
-            return  # no token, self.current_user_obj stays None
+            return  # no token, self.principal stays None
 
         token = auth.split(" ")[1]
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
 
-            user_id = payload.get("sub")
+        # a token seen recently was already verified (and maybe its user loaded)
+        cached = auth_cache.get(token)
+        if cached:
+            payload, self.current_user_obj = cached
+        else:
+            try:
+                payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+            except jwt.ExpiredSignatureError:
+                logging.warning("JWT token expired")
+                return  # invalid token, leave principal as None
+            except jwt.InvalidTokenError as e:
+                logging.error("Invalid JWT token: %s", e)
+                return
+
+            if not payload.get("sub") or auth_cache.is_deleted(int(payload["sub"])):
+                return  # no user, or the user was deleted (the tokens of deleted users are not cached)
+            auth_cache.put(token, payload)
+
+        self._token = token
+        self.principal = Principal(int(payload["sub"]), payload.get("username"))
+        if self.load_user and not await self.load_current_user():
+            self.principal = None  # the user of the token no longer exists
+
+    async def load_current_user(self):
+        """Return the authenticated User object, fetching it on first use. None if not authenticated."""
+        if self.current_user_obj is None and self.principal is not None:
+            self.current_user_obj = await User.get_or_none(id=self.principal.id)
+            if self.current_user_obj:
+                auth_cache.set_user(self._token, self.current_user_obj)
+        return self.current_user_obj
 
-            if user_id:
-                self.current_user_obj = await User.get_or_none(id=int(user_id))
-        except jwt.ExpiredSignatureError:
-            logging.warning("JWT token expired")
-            return  # invalid token, leave current_user_obj as None
-        except jwt.InvalidTokenError as e:
-            logging.error("Invalid JWT token: %s", e)
-            return
+    async def reject_deleted_user(self):
+        """Raise 401 if the user of the token no longer exists, for writes that failed without loading it"""
+        if self.principal is not None and not await User.exists(id=self.principal.id):
+            auth_cache.forget_user(self.principal.id)
+            raise HTTPError(401, "Unauthorized")
 
     @property
     def current_user(self):
-        """Returns the authenticated User object, or None"""
-        return self.current_user_obj
+        """Returns the authenticated User object if it was loaded, else the Principal, or None"""
+        return self.current_user_obj or self.principal
 
     def require_auth(self):
         """Raise 401 if user not authenticated. Add this to the beginning of any handler method that requires auth."""
         if not self.current_user:
             raise HTTPError(401, "Unauthorized")
 
-    def write_error(self, status_code, **kwargs):
-        """Return JSON for all errors instead of HTML"""
-        self.set_header("Content-Type", "application/json")
-        if "exc_info" in kwargs:
-            exc = kwargs["exc_info"][1]
-            self.finish({"error": str(exc)})
-        else:
-            self.finish({"error": self._reason})
+    async def stream_json_list(self, key, batches, serialize):
+        """Write `{key: [...]}` incrementally: each batch of rows is serialized, written and flushed
+        before the next one is loaded, so memory stays bounded by the batch size.
+        Always JSON, MessagePack needs the length of the list before its items."""
+        self.set_header("Content-Type", JSON_CONTENT_TYPE)
+        self.write(b'{' + self.timed_encode(encode_json, key) + b': [')
+        separator = b""
+        try:
+            async for rows in batches:
+                self.write(separator + b",".join(self.timed_encode(encode_json, serialize(row)) for row in rows))
+                separator = b","
+                await self.flush()
+        except StreamClosedError:
+            logging.info("Client closed the connection during a streamed response")
+            return
+        self.write(b"]}")
+
+    def write_cached_response(self):
+        """Answer a GET from the response cache. Returns False on a miss, the handler then builds the response itself."""
+        entry = response_cache.get(self._cache_key())
+        if entry is None:
+            return False
+        self._write_encoded_body(entry.body, entry.etag)
+        return True
+
+    def write_and_cache(self, data, *tags):
+        """Write a response and cache it under the request uri until one of the tags is invalidated.
+        Only use it for responses that are the same for every caller."""
+        body = self.timed_encode(self.response_format[1], data)
+        self._write_encoded_body(body, response_cache.put(self._cache_key(), body, tags))
+
+    def _cache_key(self):
+        # the same uri is cached once per format
+        content_type = self.response_format[0]
+        return self.request.uri if content_type == JSON_CONTENT_TYPE else f"{content_type} {self.request.uri}"
+
+    def _write_encoded_body(self, body, etag):
+        # Tornado skips its own If-None-Match check once an Etag is set, so it is done here
+        self.set_header("Etag", etag)
+        self.set_header("Vary", "Accept")
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        self.set_header("Content-Type", self.response_format[0])
+        self.write(body)
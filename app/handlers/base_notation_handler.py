@@ -1,9 +1,10 @@
 import tornado
-from app.handlers.base_auth_handler import BaseAuthHandler
+from app.handlers.base_auth_handler import BaseAuthHandler, rejects_deleted_user
 from app.service.notation_service import (
     validate_notation_value,
     create_notation,
     update_notation,
+    set_notation,
     get_notation_summary,
 )
 import logging
@@ -13,6 +14,7 @@ class BaseNotationHandler(BaseAuthHandler):
     """Generic notation handler for any notation model"""
 
     notation_model = None  # subclass should set this
+    load_user = False  # the notation service only needs the caller's id
 
     async def handle_notation(self, object_id, service_method):
         self.require_auth()
@@ -32,12 +34,18 @@ class BaseNotationHandler(BaseAuthHandler):
         self.set_status(status)
         self.write(resp)
 
+    @rejects_deleted_user
     async def post(self, object_id):
         await self.handle_notation(object_id, create_notation)
 
+    @rejects_deleted_user
     async def patch(self, object_id):
         await self.handle_notation(object_id, update_notation)
 
+    @rejects_deleted_user
+    async def put(self, object_id):
+        await self.handle_notation(object_id, set_notation)
+
     async def get(self, object_id):
         self.require_auth()
         resp, status = await get_notation_summary(self.notation_model, self.current_user, object_id)
@@ -1,25 +1,43 @@
 import tornado
+from tortoise.expressions import Q
 
-from app.handlers.base_auth_handler import BaseAuthHandler
+from app.handlers.base_auth_handler import BaseAuthHandler, rejects_deleted_user
 from app.models import Feedback, Comment
+from app.service.comment_service import validate_comment_data
+from app.service.pagination import parse_limit, decode_cursor, encode_cursor, fetch_page, iter_batches
+from app.service.response_cache import response_cache
+
+
+def serialize_comment(c):
+    return {
+        "id": c.id,
+        "user_id": c.user.id,
+        "username": c.user.username,
+        "feedback_id": c.feedback_id,
+        "content": c.content,
+        "score": c.score,
+    }
 
 
 class CommentHandler(BaseAuthHandler):
+    load_user = False  # only the caller's id is needed
+
+    @rejects_deleted_user
     async def post(self):
         """Post a comment on a specific feedback"""
         self.require_auth()  # ensures only logged-in users can comment
 
         data = tornado.escape.json_decode(self.request.body)
-        comment_text = data.get("content")
-        feedback_id = data.get("feedback_id")
-
-        if not comment_text:
-            self.set_status(400)
-            self.write({"error": "Comment content is required"})
+        error, status = validate_comment_data(data)
+        if error:
+            self.set_status(status)
+            self.write(error)
             return
+        comment_text = data["content"]
+        feedback_id = data["feedback_id"]
+
         # Validate feedback_id
-        feedback = await Feedback.get_or_none(id=feedback_id)
-        if not feedback:
+        if not await Feedback.exists(id=feedback_id):
             self.set_status(404)
             self.write({"error": "Feedback not found"})
             return
@@ -27,44 +45,87 @@ class CommentHandler(BaseAuthHandler):
         comment = await Comment.create(
             feedback_id=feedback_id,
             content=comment_text,
-            user=self.current_user
+            user_id=self.current_user.id
         )
+        response_cache.invalidate(("comments", feedback_id))  # the cached comment pages of the feedback
         self.set_status(201)
         self.write({"id": comment.id, "text": comment.content, "message": "Comment created"})
 
 
 class SingleCommentHandler(BaseAuthHandler):
+    load_user = False
+
     async def get(self, comment_id):
+        if self.write_cached_response():
+            return
         comment = await Comment.get_or_none(id=comment_id).select_related("user", "feedback")
         if not comment:
             self.set_status(404)
             return self.write({"error": "Comment not found"})
-        self.write({
+        self.write_and_cache({
             "id": comment.id,
             "user_id": comment.user.id,
             "username": comment.user.username,
             "feedback_id": comment.feedback.id,
             "content": comment.content
-        })
+        }, ("comment", comment.id))
 
 
 class FeedbackCommentsHandler(BaseAuthHandler):
-    async def get(self, feedback_id):
+    load_user = False
+    # sort -> (ordering, number of values in the cursor); every ordering is backed by a Comment index
+    SORTS = {
+        "oldest": (("id",), 1),
+        "newest": (("-id",), 1),
+        "score": (("-score", "-id"), 2),
+    }
 
-        feedback = await Feedback.get_or_none(id=feedback_id)
-        if not feedback:
+    async def get(self, feedback_id):
+        """Get a page of the comments of a feedback, `?limit=&after=<next_cursor>&sort=oldest|newest|score`.
+        `?stream=true` streams every comment of the feedback oldest first instead."""
+        if self.write_cached_response():
+            return
+        if not await Feedback.exists(id=feedback_id):
             self.set_status(404)
             return self.write({"error": "Feedback not found"})
 
-        comments = await Comment.filter(feedback_id=feedback_id).select_related("user")
-        self.write({
-            "comments": [
-                {
-                    "id": c.id,
-                    "user_id": c.user.id,
-                    "username": c.user.username,
-                    "feedback_id": feedback_id,
-                    "content": c.content,
-                } for c in comments
-            ]
-        })
+        if self.get_argument("stream", "false").lower() == "true":
+            query = Comment.filter(feedback_id=feedback_id).select_related("user")
+            return await self.stream_json_list("comments", iter_batches(query), serialize_comment)
+
+        sort = self.get_argument("sort", "oldest")
+        if sort not in self.SORTS:
+            self.set_status(400)
+            return self.write({"error": "Sort must be one of: " + ", ".join(self.SORTS)})
+        ordering, cursor_size = self.SORTS[sort]
+        try:
+            limit = parse_limit(self.get_argument("limit", None))
+            after = self.get_argument("after", None)
+            cursor = decode_cursor(after, cursor_size) if after else None
+        except ValueError as e:
+            self.set_status(400)
+            return self.write({"error": str(e)})
+
+        query = Comment.filter(feedback_id=feedback_id).select_related("user").order_by(*ordering)
+        if cursor:
+            # seek past the last comment of the previous page
+            if sort == "oldest":
+                query = query.filter(id__gt=cursor[0])
+            elif sort == "newest":
+                query = query.filter(id__lt=cursor[0])
+            else:
+                score, last_id = cursor
+                # score <= bound lets the (feedback, score, id) index seek, the OR alone only filters
+                query = query.filter(Q(score__lte=score), Q(score__lt=score) | Q(score=score, id__lt=last_id))
+        comments, has_more = await fetch_page(query, limit)
+
+        next_cursor = None
+        if has_more:
+            last = comments[-1]
+            next_cursor = encode_cursor(last.score, last.id) if sort == "score" else encode_cursor(last.id)
+
+        # votes change the scores, they invalidate the tag through the notation service
+        self.write_and_cache({
+            "comments": [serialize_comment(c) for c in comments],
+            "next_cursor": next_cursor,
+        }, ("comments", int(feedback_id)))
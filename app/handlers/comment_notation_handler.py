@@ -3,11 +3,15 @@ import tornado
 
 from app.service.notation_service import create_notation, update_notation, get_notation_summary, validate_notation_value
 
-from app.handlers.base_auth_handler import BaseAuthHandler
-from app.models import CommentNotation, Comment
+from app.handlers.base_auth_handler import rejects_deleted_user
+from app.handlers.base_notation_handler import BaseNotationHandler
+from app.models import CommentNotation
 
 
-class CommentNotationHandler(BaseAuthHandler):
+class CommentNotationHandler(BaseNotationHandler):
+    notation_model = CommentNotation  # for the inherited put (set the vote whether or not the user already voted)
+
+    @rejects_deleted_user
     async def post(self, comment_id):
         self.require_auth()
 
@@ -24,6 +28,7 @@ class CommentNotationHandler(BaseAuthHandler):
         self.set_status(status)
         self.write(res)
 
+    @rejects_deleted_user
     async def patch(self, comment_id):
         self.require_auth()
         data = tornado.escape.json_decode(self.request.body)
@@ -41,12 +46,7 @@ class CommentNotationHandler(BaseAuthHandler):
     # get summary of notations for a comment
     async def get(self, comment_id):
         self.require_auth()
-        # Validate comment_id
-        comment = await Comment.get_or_none(id=comment_id)
-        if not comment:
-            self.set_status(404)
-            self.write({"error": "Comment not found"})
-            return
+        # returns 404 itself when the comment does not exist
         res, status = await get_notation_summary(CommentNotation, self.current_user, comment_id)
         self.set_status(status)
         self.write(res)
@@ -1,55 +1,142 @@
 import tornado
 
-from app.handlers.base_auth_handler import BaseAuthHandler
+from app.handlers.base_auth_handler import BaseAuthHandler, rejects_deleted_user
 from app.models import Feedback
+from app.service.feedback_service import (
+    parse_include,
+    get_feedback_stats,
+    validate_feedback_data,
+    create_feedback,
+    get_rating_stats,
+)
+from app.service.pagination import parse_limit, decode_cursor, encode_cursor, fetch_page, iter_batches
+
+DEFAULT_TOP_SIZE = 10
+
+
+def serialize_feedback(fb):
+    return {
+        "id": fb.id,
+        "user_id": fb.user.id,
+        "username": fb.user.username,  # for display purpose
+        "note": fb.note,
+        "rating": fb.rating
+    }
 
 
 class FeedbackHandler(BaseAuthHandler):
+    load_user = False  # only the caller's id is needed
+
+    @rejects_deleted_user
     async def post(self):
         self.require_auth()  # ensures only logged-in users can post
 
         data = tornado.escape.json_decode(self.request.body)
-        feedback_text = data.get("note")
-        rating = data.get("rating")
-
-        if rating is None or not isinstance(rating, int) or not (1 <= rating <= 5):
-            self.set_status(400)
-            self.write({"error": "Rating must be an integer between 1 and 5"})
+        error, status = validate_feedback_data(data)
+        if error:
+            self.set_status(status)
+            self.write(error)
             return
 
-        # Use self.current_user directly
-        feedback = await Feedback.create(
-            user=self.current_user,
-            note=feedback_text,
-            rating=rating
-        )
+        # the id from the token is enough, no need to load the user
+        feedback = await create_feedback(self.current_user.id, data.get("note"), data["rating"])
         self.set_status(201)
         self.write({"id": feedback.id, "note": feedback.note, "message": "Feedback created"})
 
     async def get(self, feedback_id=None):
-        """Get all feedbacks or a single feedback by id, both are lazy loaded if u need the comments call `methodname`.
+        """Get a page of feedbacks or a single feedback by id, both are lazy loaded if u need the comments call `methodname`.
+        The list is paginated with `?limit=&after=<next_cursor of the previous page>`,
+        `?include=stats` adds comment_count and the notation counts (and the caller's vote) to each feedback,
+        `?stream=true` streams every feedback instead (full exports).
        """
         if feedback_id:
+            if self.write_cached_response():
+                return
             feedback = await Feedback.get_or_none(id=feedback_id).prefetch_related('user')
             if not feedback:
                 self.set_status(404)
                 self.write({"error": "Feedback not found"})
                 return
-            self.write({
+            self.write_and_cache({
                 "id": feedback.id,
                 "user_id": feedback.user.id,
                 "username": feedback.user.username,  # for display purpose
                 "note": feedback.note,
                 "rating": feedback.rating,
 
-            })
+            }, ("feedback", feedback.id))
+        elif self.get_argument("stream", "false").lower() == "true":
+            await self.stream_json_list(
+                "feedbacks", iter_batches(Feedback.all().select_related('user')), serialize_feedback
+            )
         else:
-            all_feedbacks = await Feedback.all().prefetch_related('user')
-            feedback_list = [{
-                "id": fb.id,
-                "user_id": fb.user.id,
-                "username": fb.user.username,  # for display purpose
-                "note": fb.note,
-                "rating": fb.rating
-            } for fb in all_feedbacks]
-            self.write({"feedbacks": feedback_list})
+            try:
+                limit = parse_limit(self.get_argument("limit", None))
+                after = self.get_argument("after", None)
+                after_id = decode_cursor(after)[0] if after else None
+                include = parse_include(self.get_argument("include", None))
+            except ValueError as e:
+                self.set_status(400)
+                self.write({"error": str(e)})
+                return
+
+            # seek by primary key so deep pages cost the same as the first one
+            query = Feedback.all().select_related('user').order_by("id")
+            if after_id is not None:
+                query = query.filter(id__gt=after_id)
+            feedbacks, has_more = await fetch_page(query, limit)
+
+            items = [serialize_feedback(fb) for fb in feedbacks]
+            if "stats" in include:
+                # a couple of queries for the whole page, not one per feedback
+                stats = await get_feedback_stats(feedbacks, self.current_user)
+                for item in items:
+                    item.update(stats[item["id"]])
+
+            self.write({
+                "feedbacks": items,
+                "next_cursor": encode_cursor(feedbacks[-1].id) if has_more else None,
+            })
+
+
+class FeedbackStatsHandler(BaseAuthHandler):
+    load_user = False
+
+    async def get(self):
+        """Count, mean and 1-5 histogram of the ratings, `?user_id=` for the feedbacks of one user.
+        Read from the rating statistics kept by every feedback write, not computed over the feedback table."""
+        user_id = self.get_argument("user_id", None)
+        if user_id is not None:
+            try:
+                user_id = int(user_id)
+            except ValueError:
+                user_id = 0
+            if user_id < 1:  # 0 is the row of all the feedbacks in the statistics table
+                self.set_status(400)
+                return self.write({"error": "user_id must be a positive integer"})
+        self.write(await get_rating_stats(user_id))
+
+
+class TopFeedbackHandler(BaseAuthHandler):
+    load_user = False
+
+    async def get(self):
+        """The most helpful feedbacks, `?limit=` of them (default 10, max 200), best first.
+        Ranked by the stored wilson_score, so a few unanimous votes don't outrank many mostly positive ones;
+        the read walks the (wilson_score, id) index and stops after `limit` rows."""
+        try:
+            limit = parse_limit(self.get_argument("limit", None), default=DEFAULT_TOP_SIZE)
+        except ValueError as e:
+            self.set_status(400)
+            return self.write({"error": str(e)})
+
+        feedbacks = await Feedback.all().select_related('user').order_by("-wilson_score", "-id").limit(limit)
+        self.write({"feedbacks": [
+            {
+                **serialize_feedback(fb),
+                "positive_notations": fb.positive_count,
+                "negative_notations": fb.negative_count,
+                "score": round(fb.wilson_score, 4),
+            }
+            for fb in feedbacks
+        ]})
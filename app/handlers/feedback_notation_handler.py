@@ -1,5 +1,6 @@
 import tornado
-from app.handlers.base_auth_handler import BaseAuthHandler
+from app.handlers.base_auth_handler import rejects_deleted_user
+from app.handlers.base_notation_handler import BaseNotationHandler
 from app.models import FeedbackNotation
 from app.service.notation_service import (
     validate_notation_value,
@@ -9,7 +10,10 @@ from app.service.notation_service import (
 )
 
 
-class FeedBackNotationHandler(BaseAuthHandler):
+class FeedBackNotationHandler(BaseNotationHandler):
+    notation_model = FeedbackNotation  # for the inherited put (set the vote whether or not the user already voted)
+
+    @rejects_deleted_user
     async def post(self, feedback_id):
         self.require_auth()
         data = tornado.escape.json_decode(self.request.body)
@@ -26,6 +30,7 @@ class FeedBackNotationHandler(BaseAuthHandler):
         self.set_status(status)
         self.write(resp)
 
+    @rejects_deleted_user
     async def patch(self, feedback_id):
         self.require_auth()
         data = tornado.escape.json_decode(self.request.body)
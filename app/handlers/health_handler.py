@@ -1,6 +1,6 @@
-import tornado
+from app.handlers.base_auth_handler import BaseHandler
 
 
-class HealthCheckHandler(tornado.web.RequestHandler):
+class HealthCheckHandler(BaseHandler):
     def get(self):
-        self.write({"message": "App is running"})
\ No newline at end of file
+        self.write({"message": "App is running"})
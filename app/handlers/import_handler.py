@@ -0,0 +1,154 @@
+# app/handlers/import_handler.py
+import os
+
+import tornado.web
+from tornado.escape import json_decode
+from tortoise.transactions import in_transaction
+
+from app.handlers.base_auth_handler import BaseAuthHandler, rejects_deleted_user
+from app.models import Feedback, Comment
+from app.service.comment_service import validate_comment_data
+from app.service.feedback_service import validate_feedback_data, record_ratings
+from app.service.response_cache import response_cache
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))  # records per bulk insert / transaction
+IMPORT_MAX_BODY_SIZE = int(os.getenv("IMPORT_MAX_BODY_SIZE", str(1024 ** 3)))  # bytes, the body is never held whole
+IMPORT_MAX_LINE_SIZE = 64 * 1024  # longer lines are rejected without being buffered
+MAX_REPORTED_ERRORS = 100  # rejected lines listed in the response, all of them are counted
+
+
+def build_feedback(data, user_id):
+    return Feedback(user_id=user_id, note=data.get("note"), rating=data["rating"])
+
+
+def build_comment(data, user_id):
+    return Comment(user_id=user_id, feedback_id=data["feedback_id"], content=data["content"])
+
+
+@tornado.web.stream_request_body
+class BaseImportHandler(BaseAuthHandler):
+    """Import records from an NDJSON body (one JSON object per line) as it is received.
+    Lines are validated as they arrive and valid records are inserted every IMPORT_CHUNK_SIZE lines,
+    each chunk with one bulk insert in its own transaction, so memory stays bounded whatever the upload size.
+    Subclasses set `model`, `validator` and `builder`."""
+
+    model = None  # subclass should set this
+    validator = None  # subclass should set this: data -> (error, status), (None, None) when valid
+    builder = None  # subclass should set this: (data, user_id) -> unsaved record
+    load_user = False  # records are owned by the caller, only the id is needed
+
+    async def prepare(self):
+        await super().prepare()
+        self.require_auth()  # reject before any of the body is read
+        # errors raised while the body is received drop the connection without a response,
+        # so the user is checked once here rather than when a chunk fails to insert
+        await self.reject_deleted_user()
+        self.request.connection.set_max_body_size(IMPORT_MAX_BODY_SIZE)
+        self._buffer = b""  # incomplete last line of the chunks received so far
+        self._skipping_line = False  # inside a line that went over IMPORT_MAX_LINE_SIZE
+        self._line_number = 0
+        self._pending = []  # (line number, unsaved record) waiting for the next bulk insert
+        self.accepted = 0
+        self.rejected = 0
+        self.errors = []
+
+    async def data_received(self, chunk):
+        # Tornado waits for this coroutine before reading more, so a slow insert slows the upload down
+        lines = (self._buffer + chunk).split(b"\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            if self._skipping_line:
+                self._skipping_line = False  # end of the oversized line
+                continue
+            await self.add_line(line)
+        if len(self._buffer) > IMPORT_MAX_LINE_SIZE:
+            self._buffer = b""
+            if not self._skipping_line:
+                self._skipping_line = True
+                self.reject(self._line_number + 1, "Line is too long")
+                self._line_number += 1
+
+    async def add_line(self, line):
+        self._line_number += 1
+        if not line.strip():
+            return
+        try:
+            data = json_decode(line)
+        except ValueError:
+            return self.reject(self._line_number, "Invalid JSON")
+
+        error, _ = self.validator(data)
+        if error:
+            return self.reject(self._line_number, error["error"])
+        self._pending.append((self._line_number, self.builder(data, self.current_user.id)))
+        if len(self._pending) >= IMPORT_CHUNK_SIZE:
+            await self.flush_pending()
+
+    def reject(self, line_number, error):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "error": error})
+
+    async def check_pending(self, pending):
+        """Hook for the checks that need the DB, done once per chunk. Returns the records to insert."""
+        return pending
+
+    async def flush_pending(self):
+        pending, self._pending = self._pending, []
+        if pending:
+            pending = await self.check_pending(pending)
+        if not pending:
+            return
+        records = [record for _, record in pending]
+        async with in_transaction():
+            await self.model.bulk_create(records)
+            await self.on_insert(records)
+        self.accepted += len(pending)
+        self.after_flush(records)
+
+    async def on_insert(self, records):
+        """Hook called in the transaction of a chunk, after its insert"""
+
+    def after_flush(self, records):
+        """Hook called once a chunk is committed"""
+
+    @rejects_deleted_user
+    async def post(self):
+        if self._buffer and not self._skipping_line:
+            await self.add_line(self._buffer)  # last line without a trailing newline
+        self._buffer = b""
+        await self.flush_pending()
+        self.write({"accepted": self.accepted, "rejected": self.rejected, "errors": self.errors})
+
+
+class FeedbackImportHandler(BaseImportHandler):
+    """POST /api/feedback/import, one {"note", "rating"} per line"""
+    model = Feedback
+    validator = staticmethod(validate_feedback_data)
+    builder = staticmethod(build_feedback)
+
+    async def on_insert(self, records):
+        await record_ratings(self.current_user.id, [record.rating for record in records])
+
+
+class CommentImportHandler(BaseImportHandler):
+    """POST /api/comment/import, one {"feedback_id", "content"} per line"""
+    model = Comment
+    validator = staticmethod(validate_comment_data)
+    builder = staticmethod(build_comment)
+
+    async def check_pending(self, pending):
+        # one query for the feedbacks of the whole chunk
+        feedback_ids = list({record.feedback_id for _, record in pending})
+        found = set(await Feedback.filter(id__in=feedback_ids).values_list("id", flat=True))
+        kept = []
+        for line_number, record in pending:
+            if record.feedback_id in found:
+                kept.append((line_number, record))
+            else:
+                self.reject(line_number, "Feedback not found")
+        return kept
+
+    def after_flush(self, records):
+        # the cached comment pages of these feedbacks miss the new comments
+        response_cache.invalidate(*{("comments", record.feedback_id) for record in records})
@@ -0,0 +1,17 @@
+# app/handlers/metrics_handler.py
+from tornado.web import HTTPError
+
+from app.handlers.base_auth_handler import BaseHandler
+from app.service.metrics import METRICS_ENABLED, metrics
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsHandler(BaseHandler):
+    """Request metrics of this process in the Prometheus text format, for the scraper"""
+
+    def get(self):
+        if not METRICS_ENABLED:
+            raise HTTPError(404)
+        self.set_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.write(metrics.render())
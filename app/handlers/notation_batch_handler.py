@@ -0,0 +1,31 @@
+# app/handlers/notation_batch_handler.py
+import tornado
+
+from app.handlers.base_auth_handler import BaseAuthHandler, rejects_deleted_user
+from app.service.notation_service import set_notations, MAX_BATCH_NOTATIONS
+
+
+class NotationBatchHandler(BaseAuthHandler):
+    load_user = False  # the notation service only needs the caller's id
+
+    @rejects_deleted_user
+    async def post(self):
+        """Set many notations of the caller in one request (e.g. votes synced from offline),
+        the body is a JSON array of {entity_type, entity_id, value}"""
+        self.require_auth()
+        try:
+            items = tornado.escape.json_decode(self.request.body)
+        except ValueError:
+            self.set_status(400)
+            return self.write({"error": "Invalid JSON body"})
+
+        if not isinstance(items, list) or not items:
+            self.set_status(400)
+            return self.write({"error": "Body must be a non-empty JSON array of notations"})
+        if len(items) > MAX_BATCH_NOTATIONS:
+            self.set_status(400)
+            return self.write({"error": f"At most {MAX_BATCH_NOTATIONS} notations per batch"})
+
+        # one result per item, in the order of the request
+        results = await set_notations(self.current_user, items)
+        self.write({"results": results})
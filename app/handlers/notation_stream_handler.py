@@ -0,0 +1,96 @@
+# app/handlers/notation_stream_handler.py
+import asyncio
+import os
+
+from tornado.iostream import StreamClosedError
+
+from app.handlers.base_auth_handler import BaseAuthHandler
+from app.handlers.notation_summaries_handler import parse_ids
+from app.models import Feedback, Comment
+from app.service.notation_events import notation_events
+from app.service.notation_service import read_counters
+from app.service.pagination import MAX_PAGE_SIZE
+from app.service.serialization import encode_json
+
+SSE_TICK_MS = int(os.getenv("SSE_TICK_MS", "500"))  # changes within a tick are sent as one update
+SSE_KEEPALIVE_SECONDS = int(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+# ?feedback=&comment= query argument -> owning model
+STREAM_MODELS = {"feedback": Feedback, "comment": Comment}
+
+
+class NotationStreamHandler(BaseAuthHandler):
+    """Server-Sent Events stream of the notation counts of some feedbacks and comments,
+    `?feedback=1,2&comment=3`. Public like the counts in the feedback list, EventSource can't send a token."""
+
+    load_user = False
+
+    async def get(self):
+        keys = []
+        try:
+            for entity_type in STREAM_MODELS:
+                value = self.get_argument(entity_type, None)
+                if value is not None:
+                    keys += [(entity_type, entity_id) for entity_id in parse_ids(value)]
+        except ValueError as e:
+            self.set_status(400)
+            return self.write({"error": str(e)})
+        if not keys:
+            self.set_status(400)
+            return self.write({"error": "Subscribe to at least one feedback or comment"})
+        if len(keys) > MAX_PAGE_SIZE:
+            self.set_status(400)
+            return self.write({"error": f"At most {MAX_PAGE_SIZE} ids per request"})
+
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("X-Accel-Buffering", "no")  # don't let a proxy hold the events back
+        self.subscription = notation_events.subscribe(keys)
+        sent = {}  # (entity_type, id) -> counts last sent to the client
+        last_write = asyncio.get_running_loop().time()
+        try:
+            while not self.subscription.closed:
+                # read every tick: the votes written by the other workers are not published in this process
+                counters = await self.read_summaries(self.subscription.keys)
+                changed = {key: counts for key, counts in counters.items() if sent.get(key) != counts}
+                now = asyncio.get_running_loop().time()
+                if changed:
+                    self.write_summaries(changed)  # the current counts first, then only what changed
+                    sent.update(changed)
+                    last_write = now
+                elif now - last_write >= SSE_KEEPALIVE_SECONDS:
+                    self.write(": keepalive\n\n")  # also finds out about clients that went away
+                    last_write = now
+                # waits for a slow client, the next read then sends the latest counts only
+                await self.flush()
+                if changed:
+                    await asyncio.sleep(SSE_TICK_MS / 1000)  # the changes within a tick are sent together
+                # a vote written by this worker wakes the stream up at once, the others are read after a tick
+                await self.subscription.wait(SSE_TICK_MS / 1000)
+        except StreamClosedError:
+            pass
+        finally:
+            notation_events.unsubscribe(self.subscription)
+
+    async def read_summaries(self, keys):
+        """Current counts {(entity_type, id): (positive, negative)}, one query per entity type"""
+        counters = {}
+        for entity_type, model in STREAM_MODELS.items():
+            entity_ids = [entity_id for key_type, entity_id in keys if key_type == entity_type]
+            if entity_ids:
+                for entity_id, counts in (await read_counters(model, entity_ids)).items():
+                    counters[entity_type, entity_id] = counts
+        return counters
+
+    def write_summaries(self, counters):
+        """One `summary` event per entity"""
+        for (entity_type, entity_id), (positive, negative) in counters.items():
+            self.write(b"event: summary\ndata: " + encode_json({
+                "entity_type": entity_type,
+                "id": entity_id,
+                "positive_notations": positive,
+                "negative_notations": negative,
+            }) + b"\n\n")
+
+    def on_connection_close(self):
+        if getattr(self, "subscription", None) is not None:
+            self.subscription.close()
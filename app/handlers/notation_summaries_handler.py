@@ -0,0 +1,45 @@
+# app/handlers/notation_summaries_handler.py
+from app.handlers.base_auth_handler import BaseAuthHandler
+from app.models import FeedbackNotation, CommentNotation
+from app.service.notation_service import get_notation_summaries
+from app.service.pagination import MAX_PAGE_SIZE
+
+
+def parse_ids(value, maximum=MAX_PAGE_SIZE):
+    """Parse an `ids=1,2,3` query argument into a list of ints. Raises ValueError if it is invalid."""
+    try:
+        ids = [int(part) for part in (value or "").split(",") if part.strip()]
+    except ValueError:
+        raise ValueError("ids must be a comma separated list of integers")
+    if not ids:
+        raise ValueError("ids is required")
+    if len(ids) > maximum:
+        raise ValueError(f"At most {maximum} ids per request")
+    return ids
+
+
+class BaseNotationSummariesHandler(BaseAuthHandler):
+    """Notation summaries of many entities in one request, `?ids=1,2,3`"""
+
+    notation_model = None  # subclass should set this
+    load_user = False  # the notation service only needs the caller's id
+
+    async def get(self):
+        self.require_auth()
+        try:
+            entity_ids = parse_ids(self.get_argument("ids", None))
+        except ValueError as e:
+            self.set_status(400)
+            return self.write({"error": str(e)})
+
+        resp, status = await get_notation_summaries(self.notation_model, self.current_user, entity_ids)
+        self.set_status(status)
+        self.write(resp)
+
+
+class FeedbackNotationSummariesHandler(BaseNotationSummariesHandler):
+    notation_model = FeedbackNotation
+
+
+class CommentNotationSummariesHandler(BaseNotationSummariesHandler):
+    notation_model = CommentNotation
@@ -0,0 +1,39 @@
+from tortoise.exceptions import OperationalError
+
+from app.handlers.base_auth_handler import BaseAuthHandler
+from app.service.pagination import parse_limit, decode_cursor, encode_cursor
+from app.service.search_service import search, search_available
+
+MAX_SEARCH_OFFSET = 10000  # ranked results can't seek, deeper pages would re-rank too many matches
+
+
+class SearchHandler(BaseAuthHandler):
+    load_user = False  # public, like the feedback list
+
+    async def get(self):
+        """Search feedback notes and comments, `?q=` words and "quoted phrases" that must all match.
+        Hits come best match first, paginated with `?limit=&after=<next_cursor of the previous page>`."""
+        if not search_available():
+            self.set_status(501)
+            return self.write({"error": "Search is only available with SQLite"})
+        try:
+            q = self.get_argument("q", "")
+            limit = parse_limit(self.get_argument("limit", None))
+            after = self.get_argument("after", None)
+            # the cursor is the offset of the next page, ordering by rank has no key to seek past
+            offset = decode_cursor(after)[0] if after else 0
+            if not 0 <= offset <= MAX_SEARCH_OFFSET:
+                raise ValueError("Invalid cursor")  # only forged cursors go past the last page handed out
+            hits, has_more = await search(q, limit, offset)
+        except ValueError as e:
+            self.set_status(400)
+            return self.write({"error": str(e)})
+        except OperationalError:
+            self.set_status(400)
+            return self.write({"error": "Invalid search query"})
+
+        next_offset = offset + limit
+        self.write({
+            "hits": hits,
+            "next_cursor": encode_cursor(next_offset) if has_more and next_offset <= MAX_SEARCH_OFFSET else None,
+        })
@@ -1,20 +1,24 @@
 # app/handlers/user_handler.py
 
 
-import tornado.web
 import tornado.escape
 import jwt
 import datetime
-from passlib.hash import bcrypt
 
 from tortoise.transactions import in_transaction
 from app.models import User
-from app.handlers.base_auth_handler import BaseAuthHandler, SECRET_KEY
+from app.handlers.base_auth_handler import BaseHandler, SECRET_KEY
+from app.service.password_service import hash_password, verify_password, PasswordQueueFull, RETRY_AFTER_SECONDS
 
 
+def write_busy(handler):
+    """Answer 503 when the password pool is saturated, clients should retry after Retry-After seconds"""
+    handler.set_status(503)
+    handler.set_header("Retry-After", str(RETRY_AFTER_SECONDS))
+    handler.write({"error": "Server busy, please retry later"})
 
 
-class RegisterHandler(tornado.web.RequestHandler):
+class RegisterHandler(BaseHandler):
 
     async def post(self):
 
@@ -41,7 +45,10 @@ class RegisterHandler(tornado.web.RequestHandler):
             self.write({"error": "Username already exists"})
             return
 
-        hashed_pw = bcrypt.hash(password)
+        try:
+            hashed_pw = await hash_password(password)
+        except PasswordQueueFull:
+            return write_busy(self)
 
         async with in_transaction():
             user = await User.create(username=username, password=hashed_pw)
@@ -49,7 +56,7 @@ class RegisterHandler(tornado.web.RequestHandler):
         self.write({"message": "User registered", "id": user.id})
 
 
-class LoginHandler(tornado.web.RequestHandler):
+class LoginHandler(BaseHandler):
     async def post(self):
         data = tornado.escape.json_decode(self.request.body)
         username = data.get("username")
@@ -61,7 +68,11 @@ class LoginHandler(tornado.web.RequestHandler):
             return
 
         user = await User.get_or_none(username=username)
-        if not user or not bcrypt.verify(password, user.password):
+        try:
+            valid = user is not None and await verify_password(password, user.password)
+        except PasswordQueueFull:
+            return write_busy(self)
+        if not valid:
             self.set_status(401)
             self.write({"error": "Invalid credentials"})
             return
@@ -1,35 +1,136 @@
 # app/main.py
+import asyncio
+import logging
+import os
+import signal
+
 import tornado.ioloop
 import tornado.web
-
-
+from dotenv import load_dotenv
+from tortoise import Tortoise
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes, task_id
+
+
+from app.handlers.metrics_handler import MetricsHandler
+from app.service.metrics import METRICS_ENABLED
+from app.service.notation_events import notation_events
+from app.service.notation_service import flush_votes
+from app.service.vote_buffer import vote_buffer
 from app.urls import urlpatterns
 from db.init_db import init_db# your async DB init
 
+load_dotenv()
+PORT = int(os.getenv("PORT", "8888"))
+APP_ENV = os.getenv("APP_ENV", "development")  # "production" runs the pre-forked server below
+WORKERS = int(os.getenv("WORKERS", "0"))  # production only, 0 = one worker per CPU core
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # production only, worker n serves /metrics on METRICS_PORT + n
+
 
 class Application(tornado.web.Application):
-    def __init__(self):
-        super().__init__(urlpatterns, debug=True)
+    def __init__(self, debug=True, handlers=urlpatterns):
+        super().__init__(handlers, debug=debug)
 
 
 
 async def start_app():
     await init_db()  # initialize DB
+    vote_buffer.start(flush_votes)  # write-behind votes, only when VOTE_WRITE_BEHIND is on
 
     print("DB initialized")
 
 
+async def shutdown():
+    """Write what is still buffered in memory and end the live streams, then close the DB connections"""
+    vote_buffer.stop()
+    await flush_votes()
+    notation_events.close_all()
+    await Tortoise.close_connections()
+
+
+async def stop_app():
+    await shutdown()
+    tornado.ioloop.IOLoop.current().stop()
+
+
+async def migrate_db():
+    """Create/upgrade the schema once in the parent, then close its connections before forking"""
+    await init_db()
+    await Tortoise.close_connections()
+
+
+async def serve_worker(sockets):
+    """Body of one production worker, runs after the fork"""
+    # every worker opens its own DB connections, they can't be shared across a fork
+    await init_db(migrate=False)
+    vote_buffer.start(flush_votes)
+    # the shared socket hands a scrape to any worker, whose counters differ from the previous one's and look
+    # like resets: every worker serves its own metrics on a port of its own, to be scraped as a target each
+    server = HTTPServer(Application(debug=False, handlers=[url for url in urlpatterns if url[1] is not MetricsHandler]))
+    server.add_sockets(sockets)
+    logging.info("Worker %s serving on port %s", task_id(), PORT)
+    metrics_server = None
+    if METRICS_ENABLED:
+        metrics_server = HTTPServer(tornado.web.Application([(r"/metrics", MetricsHandler)]))
+        metrics_server.listen(METRICS_PORT + task_id())
+
+    stopping = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        asyncio.get_running_loop().add_signal_handler(sig, stopping.set)
+    await stopping.wait()
+    server.stop()  # no new connections, then flush the buffered votes
+    if metrics_server is not None:
+        metrics_server.stop()
+    await shutdown()
+
+
+def forward_signals_to_workers():
+    """In the parent: pass SIGTERM/SIGINT on to the workers. Docker only signals PID 1 (the parent), which
+    would otherwise die at once and leave the workers unflushed until they are killed. fork_processes
+    then waits for the workers to flush and exit, and exits once they all did."""
+    if os.getpgrp() != os.getpid():
+        os.setpgid(0, 0)  # lead our own process group, so the signal reaches our workers only
+
+    def forward(signum, frame):
+        signal.signal(signum, signal.SIG_IGN)  # the parent is in the group too
+        os.killpg(os.getpgrp(), signum)
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, forward)
+
+
+def run_production():
+    asyncio.run(migrate_db())
+    # bind in the parent so all workers accept connections on the same socket
+    sockets = bind_sockets(PORT)
+    forward_signals_to_workers()
+    # forks the workers (and restarts them if they die), only the children return from here
+    fork_processes(WORKERS)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)  # the worker installs its own handlers in serve_worker
+    asyncio.run(serve_worker(sockets))
+
+
 if __name__ == "__main__":
-    app = Application()
+    if APP_ENV == "production":
+        logging.basicConfig(level=logging.INFO)
+        run_production()
+    else:
+        app = Application()
 
-    app.listen(8888)
-    print("Server running on http://localhost:8888")
+        app.listen(PORT)
+        print(f"Server running on http://localhost:{PORT}")
 
 
 
 
-    # Schedule async DB init inside Tornado's IOLoop
-    tornado.ioloop.IOLoop.current().add_callback(start_app)
+        # Schedule async DB init inside Tornado's IOLoop
+        tornado.ioloop.IOLoop.current().add_callback(start_app)
+        # Ctrl+C / SIGTERM flush the buffered votes before exiting
+        io_loop = tornado.ioloop.IOLoop.current()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            io_loop.asyncio_loop.add_signal_handler(sig, lambda: io_loop.add_callback(stop_app))
 
-    # Start the IOLoop
-    tornado.ioloop.IOLoop.current().start()
+        # Start the IOLoop
+        tornado.ioloop.IOLoop.current().start()
@@ -30,8 +30,16 @@ class Feedback(models.Model):
     user = fields.ForeignKeyField('models.User', related_name='feedbacks')
     rating = fields.IntField(choices=[1, 2, 3, 4, 5])  # 1-5
     note = fields.TextField(null=True)  # optional
+    positive_count = fields.IntField(default=0)  # maintained by notation_service
+    negative_count = fields.IntField(default=0)  # maintained by notation_service
+    # lower bound of the Wilson interval of the positive share of the votes, maintained by notation_service
+    wilson_score = fields.FloatField(default=0)
     notations = fields.ReverseRelation['FeedbackNotation']
 
+    class Meta:
+        # the top feedbacks are read by walking this index from its end
+        indexes = (("wilson_score", "id"),)
+
 
 # -----------------------------
 # Comment model
@@ -41,6 +49,29 @@ class Comment(models.Model):
     user = fields.ForeignKeyField('models.User', related_name='comments')
     feedback = fields.ForeignKeyField('models.Feedback', related_name='comments')
     content = fields.TextField()
+    positive_count = fields.IntField(default=0)  # maintained by notation_service
+    negative_count = fields.IntField(default=0)  # maintained by notation_service
+    score = fields.IntField(default=0)  # positive_count - negative_count, used to sort comments
+
+    class Meta:
+        # comments are always listed per feedback, by id or by score (id breaks the ties)
+        indexes = (("feedback", "id"), ("feedback", "score", "id"))
+
+
+# -----------------------------
+# Rating statistics
+# -----------------------------
+class RatingStats(models.Model):
+    """Number of feedbacks per rating, for all feedbacks and per author, maintained by feedback_service"""
+    id = fields.IntField(pk=True)
+    # author of the counted feedbacks, 0 = all feedbacks. Not a foreign key, so the all-feedbacks row
+    # shares the unique index with the per user rows
+    user_id = fields.IntField(unique=True)
+    rating_1 = fields.IntField(default=0)
+    rating_2 = fields.IntField(default=0)
+    rating_3 = fields.IntField(default=0)
+    rating_4 = fields.IntField(default=0)
+    rating_5 = fields.IntField(default=0)
 
 
 # -----------------------------
@@ -50,7 +81,19 @@ class FeedbackNotation(Notation):
     feedback = fields.ForeignKeyField('models.Feedback', related_name='notations')
     user = fields.ForeignKeyField('models.User', related_name='feedback_notations')
 
+    class Meta:
+        # one vote per user and feedback; also serves the (user, feedback) lookups of notation_service
+        unique_together = (("user", "feedback"),)
+        # per feedback counts only need the index
+        indexes = (("feedback", "value"),)
+
 
 class CommentNotation(Notation):
     comment = fields.ForeignKeyField('models.Comment', related_name='notations')
     user = fields.ForeignKeyField('models.User', related_name='comment_notations')
+
+    class Meta:
+        # one vote per user and comment; also serves the (user, comment) lookups of notation_service
+        unique_together = (("user", "comment"),)
+        # per comment counts only need the index
+        indexes = (("comment", "value"),)
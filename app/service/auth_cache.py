@@ -0,0 +1,108 @@
+# In-process cache of verified JWTs. Authenticated requests from the same client reuse the decoded
+# claims and, once a handler needed it, the User, skipping the signature check and the DB query.
+# Entries never outlive the token's own `exp`, and the cache is bounded with LRU eviction.
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from tortoise.signals import post_save, post_delete
+
+from app.models import User
+
+load_dotenv()
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))  # tokens kept, 0 disables the cache
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))  # seconds, also capped by the token's exp
+
+
+class AuthCache:
+    """LRU cache of token -> (claims, user or None) with per entry expiry"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (expires_at, claims, user); user is None until loaded
+        self._tokens_by_user = {}  # user id -> tokens, for invalidation
+        self._deleted_users = set()  # ids of the users deleted while running, their tokens are still valid JWTs
+
+    def get(self, token):
+        """Return (claims, user) for a cached token, or None"""
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        expires_at, claims, user = entry
+        if expires_at <= time.time():
+            self._remove(token)
+            return None
+        self._entries.move_to_end(token)
+        return claims, user
+
+    def put(self, token, claims, user=None):
+        if self.max_size <= 0:
+            return
+        expires_at = min(claims.get("exp", 0), time.time() + self.ttl)
+        if token in self._entries:
+            self._remove(token)
+        self._entries[token] = (expires_at, claims, user)
+        self._tokens_by_user.setdefault(int(claims["sub"]), set()).add(token)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def set_user(self, token, user):
+        """Attach the User loaded for an already cached token"""
+        entry = self._entries.get(token)
+        if entry is not None:
+            self._entries[token] = (entry[0], entry[1], user)
+
+    def invalidate_user(self, user_id):
+        """Drop every cached token of a user, call it whenever a user is changed or deleted"""
+        for token in self._tokens_by_user.pop(user_id, ()):
+            self._entries.pop(token, None)
+
+    def forget_user(self, user_id):
+        """Drop the cached tokens of a deleted user and reject its tokens from now on"""
+        self.invalidate_user(user_id)
+        self._deleted_users.add(user_id)
+
+    def is_deleted(self, user_id):
+        return user_id in self._deleted_users
+
+    def user_created(self, user_id):
+        """SQLite can give a new user the id of a deleted one"""
+        self._deleted_users.discard(user_id)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+        self._deleted_users.clear()
+
+    def _remove(self, token):
+        _, claims, _ = self._entries.pop(token)
+        user_id = int(claims["sub"])
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+auth_cache = AuthCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+
+# Changes made through the ORM invalidate automatically. Bulk queryset updates/deletes of users
+# do not send signals, call auth_cache.invalidate_user / forget_user for those. Users deleted by another
+# process are not seen here, handlers that skip loading the user catch them on write (rejects_deleted_user).
+@post_save(User)
+async def _user_saved(sender, instance, created, using_db, update_fields):
+    if created:
+        auth_cache.user_created(instance.id)
+    else:
+        auth_cache.invalidate_user(instance.id)
+
+
+@post_delete(User)
+async def _user_deleted(sender, instance, using_db):
+    auth_cache.forget_user(instance.id)
@@ -0,0 +1,16 @@
+# Validation shared by everything that creates comments (POST and imports).
+
+
+def validate_comment_data(data):
+    """Validate the body of a new comment. Returns (error, status), (None, None) when valid.
+    feedback_id is converted to an int in `data` (numeric strings like "5" are accepted, as they always were).
+    Whether the feedback exists is left to the caller, which can check many ids in one query."""
+    if not isinstance(data, dict):
+        return {"error": "Comment must be a JSON object"}, 400
+    if not data.get("content"):
+        return {"error": "Comment content is required"}, 400
+    try:
+        data["feedback_id"] = int(data.get("feedback_id"))
+    except (TypeError, ValueError):
+        return {"error": "Feedback not found"}, 404
+    return None, None
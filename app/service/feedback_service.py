@@ -0,0 +1,124 @@
+# Aggregates shown next to feedbacks in list responses, computed for a whole page at once with a fixed
+# number of queries whatever the page size, and the rating statistics kept up to date on every new feedback.
+from collections import Counter, defaultdict
+
+from tortoise.expressions import F
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
+
+from app.models import Feedback, Comment, FeedbackNotation, RatingStats
+from app.service.notation_service import overlay_buffered_vote
+
+INCLUDES = {"stats"}  # values accepted by `?include=` on the feedback list
+ALL_USERS = 0  # RatingStats.user_id of the row counting every feedback
+RATINGS = range(1, 6)
+
+
+def validate_feedback_data(data):
+    """Validate the body of a new feedback (POST and imports). Returns (error, status), (None, None) when valid."""
+    if not isinstance(data, dict):
+        return {"error": "Feedback must be a JSON object"}, 400
+    rating = data.get("rating")
+    if rating is None or not isinstance(rating, int) or isinstance(rating, bool) or not (1 <= rating <= 5):
+        return {"error": "Rating must be an integer between 1 and 5"}, 400
+    return None, None
+
+
+def parse_include(value):
+    """Parse the `include` query argument (comma separated) into a set. Raises ValueError on unknown values."""
+    include = {part.strip() for part in (value or "").split(",") if part.strip()}
+    unknown = include - INCLUDES
+    if unknown:
+        raise ValueError("Include must be one of: " + ", ".join(sorted(INCLUDES)))
+    return include
+
+
+async def get_feedback_stats(feedbacks, user=None):
+    """Return {feedback_id: stats} for a page of feedbacks: the number of comments, the positive/negative
+    notation counts and the caller's own notation (0 when anonymous or not voted).
+    The counts come from the counters on the rows already loaded, the comments from one grouped query
+    and the caller's votes from one query."""
+    feedback_ids = [fb.id for fb in feedbacks]
+    if not feedback_ids:
+        return {}
+
+    rows = await Comment.filter(feedback_id__in=feedback_ids).annotate(
+        count=Count("id")
+    ).group_by("feedback_id").values("feedback_id", "count")
+    comment_counts = {row["feedback_id"]: row["count"] for row in rows}
+
+    user_notations = {}
+    if user is not None:
+        user_notations = dict(await FeedbackNotation.filter(
+            user_id=user.id, feedback_id__in=feedback_ids
+        ).values_list("feedback_id", "value"))
+
+    stats = {}
+    for fb in feedbacks:
+        positive, negative, user_notation = fb.positive_count, fb.negative_count, user_notations.get(fb.id, 0)
+        if user is not None:
+            positive, negative, user_notation = overlay_buffered_vote(
+                FeedbackNotation, user.id, fb.id, positive, negative, user_notations.get(fb.id)
+            )
+        stats[fb.id] = {
+            "comment_count": comment_counts.get(fb.id, 0),
+            "positive_notations": positive,
+            "negative_notations": negative,
+            "user_notation": user_notation,
+        }
+    return stats
+
+
+async def create_feedback(user_id, note, rating):
+    """Create a feedback and count it in the rating statistics, in one transaction"""
+    async with in_transaction():
+        feedback = await Feedback.create(user_id=user_id, note=note, rating=rating)
+        await record_ratings(user_id, [rating])
+    return feedback
+
+
+async def record_ratings(user_id, ratings):
+    """Count new feedbacks of a user in the rating statistics (all feedbacks and the user's own).
+    Call it in the transaction that creates the feedbacks."""
+    scope = [ALL_USERS, user_id]
+    # make sure both rows exist, then increment them in place, whatever the number of feedbacks
+    await RatingStats.bulk_create([RatingStats(user_id=scope_id) for scope_id in scope], ignore_conflicts=True)
+    await RatingStats.filter(user_id__in=scope).update(**{
+        f"rating_{rating}": F(f"rating_{rating}") + count for rating, count in Counter(ratings).items()
+    })
+
+
+async def get_rating_stats(user_id=None):
+    """Count, mean and histogram of the ratings, of every feedback or of one user's, read from a single row"""
+    row = await RatingStats.filter(user_id=ALL_USERS if user_id is None else user_id).first().values(
+        *(f"rating_{rating}" for rating in RATINGS)
+    )
+    histogram = {str(rating): row[f"rating_{rating}"] if row else 0 for rating in RATINGS}
+    count = sum(histogram.values())
+    total = sum(int(rating) * n for rating, n in histogram.items())
+    return {
+        "user_id": user_id,
+        "count": count,
+        "mean": round(total / count, 2) if count else None,
+        "histogram": histogram,
+    }
+
+
+async def rebuild_rating_stats():
+    """Recompute the rating statistics from the feedback table with one grouped query.
+    Returns the number of users with feedbacks."""
+    async with in_transaction():
+        rows = await Feedback.annotate(count=Count("id")).group_by("user_id", "rating").values(
+            "user_id", "rating", "count"
+        )
+        stats = defaultdict(Counter)
+        for row in rows:
+            stats[row["user_id"]][row["rating"]] += row["count"]
+            stats[ALL_USERS][row["rating"]] += row["count"]
+
+        await RatingStats.all().delete()
+        await RatingStats.bulk_create([
+            RatingStats(user_id=user_id, **{f"rating_{rating}": count for rating, count in counts.items()})
+            for user_id, counts in stats.items()
+        ])
+    return len(stats) - (ALL_USERS in stats)
@@ -0,0 +1,171 @@
+# Per-handler request metrics: request counts by status class and latency histograms, the latency also split
+# into auth, DB and serialization time. Exposed in the Prometheus text format at /metrics and, for the request
+# itself, in a Server-Timing header. Everything is in-process counters updated once per request, cheap enough
+# to stay on in production. Every worker has its own numbers: with several workers a scrape only sees the
+# worker that answered it.
+import functools
+import os
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+
+from dotenv import load_dotenv
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+load_dotenv()
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+DB_METHODS = ("execute_query", "execute_query_dict", "execute_insert", "execute_many", "execute_script")
+PHASES = ("auth", "db", "serialize")
+
+# Timings of the request being handled, DB calls made outside of a request (flushes, startup) are not counted
+current_timings = ContextVar("current_timings", default=None)
+# Set while a timed call runs: a timed call made from it (a client method delegating to another) is the same query
+in_db_call = ContextVar("in_db_call", default=False)
+
+
+class Timings:
+    """Seconds spent per phase by one request"""
+    __slots__ = ("auth", "db", "serialize", "db_queries", "db_running", "db_started")
+
+    def __init__(self):
+        self.auth = 0.0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.db_queries = 0
+        self.db_running = 0  # queries of the request in flight
+        self.db_started = 0.0  # when the first of them started
+
+    def server_timing(self, total):
+        """Server-Timing header value, durations in milliseconds"""
+        return ", ".join(
+            [f"{phase};dur={getattr(self, phase) * 1000:.2f}" for phase in PHASES] + [f"total;dur={total * 1000:.2f}"]
+        )
+
+
+def start_timings():
+    """Start timing the current request, call it first thing in the handler"""
+    timings = Timings()
+    current_timings.set(timings)
+    return timings
+
+
+def timed_db_call(method):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        timings = current_timings.get()
+        if timings is None or in_db_call.get():
+            return await method(*args, **kwargs)
+        token = in_db_call.set(True)
+        timings.db_queries += 1
+        # concurrent queries are all counted, but the time is while at least one runs: overlaps count once
+        if not timings.db_running:
+            timings.db_started = time.perf_counter()
+        timings.db_running += 1
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            in_db_call.reset(token)
+            timings.db_running -= 1
+            if not timings.db_running:
+                timings.db += time.perf_counter() - timings.db_started
+
+    wrapper.timed = True
+    return wrapper
+
+
+def instrument_db_clients(cls=BaseDBAsyncClient):
+    """Time the queries of every loaded Tortoise client class (transaction wrappers included). Idempotent."""
+    if not METRICS_ENABLED:
+        return
+    for name in DB_METHODS:
+        method = cls.__dict__.get(name)
+        if method is not None and not getattr(method, "timed", False) and not getattr(method, "__isabstractmethod__", False):
+            setattr(cls, name, timed_db_call(method))
+    for subclass in cls.__subclasses__():
+        instrument_db_clients(subclass)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # per bucket, the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+
+
+class Metrics:
+    def __init__(self):
+        self.requests = defaultdict(int)  # (handler, method, status class) -> count
+        self.durations = defaultdict(Histogram)  # (handler, method) -> total latency
+        self.phases = defaultdict(Histogram)  # (handler, method, phase) -> latency of the phase
+        self.db_queries = defaultdict(int)  # (handler, method) -> count
+
+    def record(self, handler, method, status, total, timings=None):
+        self.requests[handler, method, f"{status // 100}xx"] += 1
+        self.durations[handler, method].observe(total)
+        if timings is not None:
+            for phase in PHASES:
+                self.phases[handler, method, phase].observe(getattr(timings, phase))
+            self.db_queries[handler, method] += timings.db_queries
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = [
+            "# HELP smartflow_http_requests_total Requests handled, by handler, method and status class.",
+            "# TYPE smartflow_http_requests_total counter",
+        ]
+        for (handler, method, status), count in sorted(self.requests.items()):
+            lines.append(f'smartflow_http_requests_total{{handler="{handler}",method="{method}",status="{status}"}} {count}')
+
+        lines += [
+            "# HELP smartflow_http_request_duration_seconds Request latency, by handler and method.",
+            "# TYPE smartflow_http_request_duration_seconds histogram",
+        ]
+        for (handler, method), histogram in sorted(self.durations.items()):
+            lines += render_histogram(
+                "smartflow_http_request_duration_seconds", f'handler="{handler}",method="{method}"', histogram
+            )
+
+        lines += [
+            "# HELP smartflow_http_request_phase_seconds Time spent in auth, DB queries and serialization per request.",
+            "# TYPE smartflow_http_request_phase_seconds histogram",
+        ]
+        for (handler, method, phase), histogram in sorted(self.phases.items()):
+            lines += render_histogram(
+                "smartflow_http_request_phase_seconds", f'handler="{handler}",method="{method}",phase="{phase}"',
+                histogram,
+            )
+
+        lines += [
+            "# HELP smartflow_db_queries_total DB queries made by requests, by handler and method.",
+            "# TYPE smartflow_db_queries_total counter",
+        ]
+        for (handler, method), count in sorted(self.db_queries.items()):
+            lines.append(f'smartflow_db_queries_total{{handler="{handler}",method="{method}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        self.requests.clear()
+        self.durations.clear()
+        self.phases.clear()
+        self.db_queries.clear()
+
+
+def render_histogram(name, labels, histogram):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{labels}}} {cumulative}")
+    return lines
+
+
+metrics = Metrics()
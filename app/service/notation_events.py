@@ -0,0 +1,78 @@
+# In-process publish/subscribe of notation counter changes, for the live summary stream
+# (app/handlers/notation_stream_handler.py). notation_service publishes the ids whose counters a committed
+# write changed; a subscriber only remembers *which* of its entities changed, not every change, so what it
+# holds is bounded by the entities it subscribed to however many votes arrive or however slowly its client
+# reads. Every process has its own subscribers, so this only wakes a stream up early for the votes of its own
+# worker: the stream also reads the counts of its entities every tick, which finds the votes of the others.
+import asyncio
+from collections import defaultdict
+
+
+class Subscription:
+    """Entities (entity_type, id) of one client and those of them that changed since it last looked"""
+
+    def __init__(self, keys):
+        self.keys = frozenset(keys)
+        self.closed = False
+        self._changed = set()
+        self._event = asyncio.Event()
+
+    def notify(self, key):
+        self._changed.add(key)
+        self._event.set()
+
+    def close(self):
+        self.closed = True
+        self._event.set()
+
+    async def wait(self, timeout):
+        """Wait until something changed, the subscription is closed or `timeout` seconds passed.
+        Returns the changed keys (empty on timeout) and starts collecting the next ones."""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+        changed, self._changed = self._changed, set()
+        return changed
+
+
+class NotationEvents:
+    def __init__(self):
+        self._subscriptions = defaultdict(set)  # (entity_type, id) -> Subscriptions
+
+    def subscribe(self, keys):
+        subscription = Subscription(keys)
+        for key in subscription.keys:
+            self._subscriptions[key].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        for key in subscription.keys:
+            subscriptions = self._subscriptions.get(key)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[key]
+
+    def close_all(self):
+        """End every subscription, their streams finish at their next tick (on shutdown)"""
+        for subscriptions in list(self._subscriptions.values()):
+            for subscription in list(subscriptions):
+                self.unsubscribe(subscription)
+
+    def publish(self, entity_type, entity_ids):
+        """The counters of these entities changed, call it once the write is committed"""
+        if not self._subscriptions:
+            return
+        for entity_id in entity_ids:
+            key = (entity_type, int(entity_id))
+            for subscription in self._subscriptions.get(key, ()):
+                subscription.notify(key)
+
+    def __len__(self):
+        return len(self._subscriptions)  # entities with at least one subscriber
+
+
+notation_events = NotationEvents()
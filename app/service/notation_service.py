@@ -1,9 +1,28 @@
 ### The reson for this file is to have  centralised methods for hnadeling notations as they fellow the same logic with the diffrance
 # that they are connected to diffrent entities. All of the validation and logic is the same so we can centralise it here.
 
-from app.models import Feedback, Comment
+import asyncio
+import logging
+import math
+from collections import defaultdict
+
+from tornado.ioloop import IOLoop
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F, Q, Subquery
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
+
+from app.models import User, Feedback, Comment, FeedbackNotation, CommentNotation
+from app.service.notation_events import notation_events
+from app.service.response_cache import response_cache
+from app.service.vote_buffer import vote_buffer
 
 VALID_VALUES = {-1, 0, 1}
+# entity_type of a batch item -> notation model
+NOTATION_MODELS = {"feedback": FeedbackNotation, "comment": CommentNotation}
+MAX_BATCH_NOTATIONS = 1000
+UPSERT_BATCH_SIZE = 500  # rows per INSERT ... ON CONFLICT statement, well under the bound parameter limits
+WILSON_Z = 1.96  # 95% confidence
 
 
 async def get_filed_name(model):
@@ -44,19 +63,115 @@ async def check_existing_notation(model, user, entity_id):
     return False, None
 
 
+def counter_delta(old_value, new_value):
+    """Return how (positive_count, negative_count) change when a vote goes from old_value to new_value.
+    old_value is None for a brand new notation."""
+    positive = (new_value == 1) - (old_value == 1)
+    negative = (new_value == -1) - (old_value == -1)
+    return positive, negative
+
+
+async def apply_counter_delta(owning_model, entity_id, old_value, new_value):
+    """Move the denormalized counters of the owning entity. Returns the number of rows updated (0 = no such entity).
+    Must be called inside the same transaction as the notation write."""
+    positive, negative = counter_delta(old_value, new_value)
+    updated = await owning_model.filter(id=entity_id).update(**counter_updates(owning_model, positive, negative))
+    if updated and (positive or negative):
+        await refresh_wilson_scores(owning_model, [entity_id])
+    return updated
+
+
+def counter_updates(owning_model, positive, negative):
+    """F-expression updates moving the counters of an owning model by (positive, negative)"""
+    updates = {
+        "positive_count": F("positive_count") + positive,
+        "negative_count": F("negative_count") + negative,
+    }
+    if owning_model is Comment:
+        updates["score"] = F("score") + (positive - negative)
+    return updates
+
+
+def counter_values(owning_model, positive, negative):
+    """Updates setting the counters of an owning model (and what is derived from them) to these counts,
+    for a row locked and read in the same transaction"""
+    if owning_model is Comment:
+        return {"positive_count": positive, "negative_count": negative, "score": positive - negative}
+    return {"positive_count": positive, "negative_count": negative, "wilson_score": wilson_score(positive, negative)}
+
+
+def wilson_score(positive, negative, z=WILSON_Z):
+    """Lower bound of the Wilson score interval of the positive share of the votes: ranks 40 up / 2 down
+    above 3 up / 0 down, where the plain ratio would not. 0 without votes."""
+    n = positive + negative
+    if not n:
+        return 0.0
+    p = positive / n
+    return (p + z * z / (2 * n) - z * math.sqrt((p * (1 - p) + z * z / (4 * n)) / n)) / (1 + z * z / n)
+
+
+async def refresh_wilson_scores(owning_model, entity_ids):
+    """Recompute the stored wilson_score of these feedbacks from their counters, comments have none.
+    Call it after the counter update, in the same transaction. Feedbacks with the same counts share one UPDATE."""
+    if owning_model is not Feedback:
+        return
+    entity_ids = list(entity_ids)
+    # chunked, the reconcile passes every feedback
+    for start in range(0, len(entity_ids), UPSERT_BATCH_SIZE):
+        rows = await Feedback.filter(
+            id__in=entity_ids[start:start + UPSERT_BATCH_SIZE]
+        ).values_list("id", "positive_count", "negative_count")
+        by_counts = defaultdict(list)
+        for entity_id, positive, negative in rows:
+            by_counts[positive, negative].append(entity_id)
+        for (positive, negative), ids in by_counts.items():
+            await Feedback.filter(id__in=ids).update(wilson_score=wilson_score(positive, negative))
+
+
+async def counters_changed(owning_model, entity_ids):
+    """Call once a write that moved the counters of these entities is committed:
+    drops the cached responses showing them and notifies the live summary subscribers."""
+    notation_events.publish(owning_model.__name__.lower(), entity_ids)
+    await invalidate_cached_responses(owning_model, entity_ids)
+
+
+async def read_counters(owning_model, entity_ids):
+    """Current counters of these entities, one query. Returns {entity_id: (positive, negative)}, unknown ids left out."""
+    rows = await owning_model.filter(id__in=list(entity_ids)).values_list("id", "positive_count", "negative_count")
+    return {entity_id: (positive, negative) for entity_id, positive, negative in rows}
+
+
+async def invalidate_cached_responses(owning_model, entity_ids):
+    """Drop the cached responses showing the counters of these entities, call it once the write is committed.
+    Only the comment pages show them (as the score), feedback responses don't."""
+    if owning_model is not Comment or not response_cache:
+        return
+    feedback_ids = await Comment.filter(id__in=list(entity_ids)).distinct().values_list("feedback_id", flat=True)
+    response_cache.invalidate(*(("comments", feedback_id) for feedback_id in feedback_ids))
+
+
 async def create_notation(model, user, entity_id, value):
     """
     Generic notation creator for FeedbackNotation and CommentNotation.
     entity_id can be either feedback_id or comment_id depending on the model.
     """
     fk_field = await get_filed_name(model)
+    owning_model = await get_owning_model(model)
 
-    # filter with the right FK
-    existing = await model.get_or_none(user=user, **{fk_field: entity_id})
-    if existing:
-        return {"error": "Can't have more than one notation per entity"}, 400
+    try:
+        async with in_transaction():
+            # the counter update doubles as the existence check of the entity
+            if not await apply_counter_delta(owning_model, entity_id, None, value):
+                return {"error": f"{owning_model.__name__} not found"}, 404
 
-    notation = await model.create(user=user, **{fk_field: entity_id}, value=value)
+            notation = await model.create(user_id=user.id, **{fk_field: entity_id}, value=value)
+    except IntegrityError:
+        if not await User.exists(id=user.id):
+            raise  # the user was deleted, not a second vote
+        # the unique (user, entity) index rejected a second vote, the counter update was rolled back
+        return {"error": "Can't have more than one notation per entity"}, 400
+    vote_buffer.discard(model, user.id, int(entity_id))  # this write supersedes a buffered PUT
+    await counters_changed(owning_model, [entity_id])
     return {"content": notation.value, "message": "Notation created"}, 201
 
 
@@ -64,28 +179,254 @@ async def update_notation(model, user, entity_id, value):
     """Update an existing notation."""
 
     fk_field = await get_filed_name(model)
-    existing = await model.get_or_none(user=user, **{fk_field: entity_id})
-    if not existing:
-        return {"error": "Notation not found"}, 404
+    owning_model = await get_owning_model(model)
 
-    existing.value = value
-    await existing.save()
+    async with in_transaction():
+        # locked before the old vote is read, or concurrent writes of the user apply deltas from the same old value
+        await lock_entities(owning_model, [entity_id])
+        existing = await model.get_or_none(user_id=user.id, **{fk_field: entity_id})
+        if not existing:
+            return {"error": "Notation not found"}, 404
+
+        old_value = existing.value
+        existing.value = value
+        await existing.save()
+        await apply_counter_delta(owning_model, entity_id, old_value, value)
+    vote_buffer.discard(model, user.id, int(entity_id))  # this write supersedes a buffered PUT
+    await counters_changed(owning_model, [entity_id])
     return {"message": "Notation updated", "content": existing.value}, 200
 
 
+async def lock_entities(owning_model, entity_ids):
+    """Lock the rows of these entities until the end of the transaction (FOR UPDATE on PostgreSQL, SQLite
+    serializes write transactions anyway), in id order so concurrent writers can't deadlock.
+    Returns the ids that exist. Must be called inside a transaction, before the votes are read."""
+    return set(await owning_model.filter(
+        id__in=list(entity_ids)
+    ).order_by("id").select_for_update().values_list("id", flat=True))
+
+
+async def lock_entity_with_vote(model, owning_model, user, entity_id):
+    """lock_entities for one entity that also reads, in the same statement, its counters and the user's vote on it.
+    Returns (positive_count, negative_count, old value or None), None if there is no such entity."""
+    fk_field = await get_filed_name(model)
+    old_vote = Subquery(model.filter(user_id=user.id, **{fk_field: entity_id}).values("value"))
+    return await owning_model.filter(id=entity_id).annotate(
+        old_value=old_vote
+    ).select_for_update().first().values_list("positive_count", "negative_count", "old_value")
+
+
+async def set_notation(model, user, entity_id, value):
+    """Create or replace the caller's notation, whether or not they already voted.
+    The vote itself is written by a single INSERT ... ON CONFLICT DO UPDATE on the unique (user, entity) index,
+    so concurrent clicks can't fail with a duplicate; the previous value is still read first because the
+    counters on the entity need it. In write-behind mode the vote is buffered instead, see buffer_notation."""
+    if vote_buffer.enabled:
+        return await buffer_notation(model, user, entity_id, value)
+
+    fk_field = await get_filed_name(model)
+    owning_model = await get_owning_model(model)
+
+    async with in_transaction():
+        # the entity row is locked as the old vote is read: a vote row that doesn't exist yet can't be
+        # locked, so two first votes would both read None and both count
+        row = await lock_entity_with_vote(model, owning_model, user, entity_id)
+        if row is None:
+            return {"error": f"{owning_model.__name__} not found"}, 404
+        positive, negative, old_value = row
+        if old_value == value:
+            return {"content": value, "message": "Notation saved"}, 200  # a repeated click, nothing to write
+        delta_positive, delta_negative = counter_delta(old_value, value)
+        if delta_positive or delta_negative:
+            # the counts are in hand and locked: one UPDATE sets them and the wilson score, no re-read
+            await owning_model.filter(id=entity_id).update(
+                **counter_values(owning_model, positive + delta_positive, negative + delta_negative)
+            )
+
+        await model.bulk_create(
+            [model(user_id=user.id, **{fk_field: entity_id}, value=value)],
+            on_conflict=("user_id", fk_field),
+            update_fields=("value",),
+        )
+    await counters_changed(owning_model, [entity_id])
+    return {"content": value, "message": "Notation saved"}, 200
+
+
+async def buffer_notation(model, user, entity_id, value):
+    """set_notation in write-behind mode: the vote waits in memory for the next flush_votes,
+    only the existence of the entity is checked now (a read, no write transaction)."""
+    owning_model = await get_owning_model(model)
+    entity_id = int(entity_id)
+    if not await owning_model.exists(id=entity_id):
+        return {"error": f"{owning_model.__name__} not found"}, 404
+
+    if vote_buffer.add(model, user.id, entity_id, value):
+        IOLoop.current().spawn_callback(flush_votes)  # full, don't wait for the interval
+    return {"content": value, "message": "Notation accepted"}, 202
+
+
+_flush_lock = asyncio.Lock()
+
+
+async def flush_votes():
+    """Write the votes waiting in the write-behind buffer in one transaction with batched statements.
+    Runs every VOTE_FLUSH_INTERVAL_MS, when the buffer is full and on shutdown."""
+    async with _flush_lock:
+        if not len(vote_buffer):
+            return
+        buffered = vote_buffer.take()
+        votes = defaultdict(dict)  # notation model -> {(user_id, entity_id): value}
+        for (model, user_id, entity_id), value in buffered.items():
+            votes[model][user_id, entity_id] = value
+
+        found = {}
+        try:
+            async with in_transaction():
+                for model, model_votes in votes.items():
+                    found[model] = await set_entity_notations(model, model_votes)
+        except Exception as e:
+            logging.exception("Could not flush %d buffered votes, they are kept for the next flush", len(buffered))
+            if isinstance(e, IntegrityError):
+                await drop_votes_of_deleted_users(buffered)
+            vote_buffer.done(failed=True)
+            return
+        vote_buffer.done()
+
+        for model, found_ids in found.items():
+            await counters_changed(await get_owning_model(model), found_ids)
+
+
+async def drop_votes_of_deleted_users(buffered):
+    """Remove from the failed flush the votes of users deleted since they voted: they fail the foreign key
+    check and would fail every following flush too"""
+    user_ids = {user_id for _, user_id, _ in buffered}
+    existing = set(await User.filter(id__in=list(user_ids)).values_list("id", flat=True))
+    for key in [key for key in buffered if key[1] not in existing]:
+        del buffered[key]
+    if len(user_ids) > len(existing):
+        logging.warning("Dropped the buffered votes of %d deleted users", len(user_ids) - len(existing))
+
+
+def overlay_buffered_vote(model, user_id, entity_id, positive, negative, stored_value):
+    """Apply the caller's vote still waiting in the write-behind buffer to the counts and vote read from the DB,
+    so users read their own writes. Returns (positive, negative, user_notation)."""
+    buffered = vote_buffer.get(model, user_id, int(entity_id)) if vote_buffer.enabled else None
+    if buffered is None:
+        return positive, negative, stored_value or 0
+    # relative to the stored vote, so it is also right once the flush committed it
+    delta_positive, delta_negative = counter_delta(stored_value, buffered)
+    return positive + delta_positive, negative + delta_negative, buffered
+
+
+async def validate_batch_item(item):
+    """Validate one {entity_type, entity_id, value} item of a batch. Returns (error, status), (None, None) when valid."""
+    if not isinstance(item, dict):
+        return {"error": "Notation must be an object"}, 400
+    if item.get("entity_type") not in NOTATION_MODELS:
+        return {"error": "entity_type must be one of: " + ", ".join(NOTATION_MODELS)}, 400
+    entity_id = item.get("entity_id")
+    if not isinstance(entity_id, int) or isinstance(entity_id, bool):
+        return {"error": "entity_id must be an integer"}, 400
+    ok, error, status = await validate_notation_value(item.get("value"))
+    if not ok:
+        return error, status
+    return None, None
+
+
+async def set_entity_notations(model, votes):
+    """Upsert votes {(user_id, entity_id): value} of one notation model with batched statements:
+    one lookup (and lock) of the entities, one of the previous votes, multi-row upserts and one counter
+    update per distinct change. Returns the ids of the entities that exist, votes on the others are skipped.
+    Must be called inside a transaction."""
+    fk_field = await get_filed_name(model)
+    owning_model = await get_owning_model(model)
+
+    # locking the entities (not the votes, the first ones don't exist yet) keeps concurrent batches
+    # from both counting a first vote
+    found = await lock_entities(owning_model, {entity_id for _, entity_id in votes})
+    votes = {key: value for key, value in votes.items() if key[1] in found}
+    if not votes:
+        return found
+
+    # may read a few more rows than needed (other pairs of these users and entities), still one query
+    rows = await model.filter(
+        user_id__in=list({user_id for user_id, _ in votes}), **{f"{fk_field}__in": list(found)}
+    ).values_list("user_id", fk_field, "value")
+    old_values = {(user_id, entity_id): value for user_id, entity_id, value in rows}
+    await model.bulk_create(
+        [model(user_id=user_id, **{fk_field: entity_id}, value=value) for (user_id, entity_id), value in votes.items()],
+        batch_size=UPSERT_BATCH_SIZE,
+        on_conflict=("user_id", fk_field),
+        update_fields=("value",),
+    )
+
+    # the changes of all users are summed per entity, entities moving by the same amount share one UPDATE
+    deltas = defaultdict(lambda: (0, 0))
+    for key, value in votes.items():
+        positive, negative = counter_delta(old_values.get(key), value)
+        deltas[key[1]] = (deltas[key[1]][0] + positive, deltas[key[1]][1] + negative)
+    by_delta = defaultdict(list)
+    for entity_id, delta in deltas.items():
+        if delta != (0, 0):
+            by_delta[delta].append(entity_id)
+    for (positive, negative), entity_ids in by_delta.items():
+        await owning_model.filter(id__in=entity_ids).update(**counter_updates(owning_model, positive, negative))
+    await refresh_wilson_scores(owning_model, [entity_id for ids in by_delta.values() for entity_id in ids])
+    return found
+
+
+async def set_notations(user, items):
+    """Set many notations of the caller at once, like set_notation for each item, in one transaction.
+    Returns one result per item, in the same order. When an entity appears more than once the last vote wins."""
+    results = [None] * len(items)
+    # notation model -> {entity_id: value} and the item indexes that target each entity
+    votes = {model: {} for model in NOTATION_MODELS.values()}
+    indexes = defaultdict(list)
+    for index, item in enumerate(items):
+        error, status = await validate_batch_item(item)
+        if error:
+            results[index] = {"status": status, **error}
+            continue
+        model = NOTATION_MODELS[item["entity_type"]]
+        votes[model][item["entity_id"]] = item["value"]
+        indexes[model, item["entity_id"]].append(index)
+        vote_buffer.discard(model, user.id, item["entity_id"])  # this write supersedes a buffered PUT
+
+    found = {}
+    async with in_transaction():
+        for model, entity_votes in votes.items():
+            if entity_votes:
+                found[model] = await set_entity_notations(
+                    model, {(user.id, entity_id): value for entity_id, value in entity_votes.items()}
+                )
+
+    for model, found_ids in found.items():
+        owning_model = await get_owning_model(model)
+        await counters_changed(owning_model, found_ids)
+        for entity_id in votes[model]:
+            for index in indexes[model, entity_id]:
+                if entity_id in found_ids:
+                    results[index] = {"status": 200, "content": items[index]["value"]}
+                else:
+                    results[index] = {"status": 404, "error": f"{owning_model.__name__} not found"}
+    return results
+
+
 async def get_notation_summary(model, user, entity_id):
-    """Return positive, negative counts and the current user's notation."""
+    """Return positive, negative counts and the current user's notation.
+    The counts come from the counters on the entity and the user's vote is a point lookup,
+    so no notation or User objects are loaded whatever the number of votes."""
     owning_model = await get_owning_model(model)
-    entity = await owning_model.get_or_none(id=entity_id)
     fk_field = await get_filed_name(model)
-    if not entity:
-        return {"error": f"{owning_model} not found"}, 404
 
-    notations = await model.filter(**{fk_field: entity_id}).all().prefetch_related("user")
+    counts = await owning_model.filter(id=entity_id).first().values("positive_count", "negative_count")
+    if not counts:
+        return {"error": f"{owning_model.__name__} not found"}, 404
 
-    positive = sum(1 for n in notations if n.value == 1)
-    negative = sum(1 for n in notations if n.value == -1)
-    user_notation = next((n.value for n in notations if n.user.id == user.id), 0)
+    user_notation = await model.filter(user_id=user.id, **{fk_field: entity_id}).first().values_list("value", flat=True)
+    positive, negative, user_notation = overlay_buffered_vote(
+        model, user.id, entity_id, counts["positive_count"], counts["negative_count"], user_notation
+    )
 
     return {
         "feedback_id": entity_id,
@@ -95,3 +436,66 @@ async def get_notation_summary(model, user, entity_id):
     }, 200
 
 
+async def get_notation_summaries(model, user, entity_ids):
+    """get_notation_summary for many entities at once: one query reads the counters of all of them and
+    one reads the caller's votes. Summaries follow the order of entity_ids, unknown ids are left out."""
+    owning_model = await get_owning_model(model)
+    fk_field = await get_filed_name(model)
+
+    rows = await owning_model.filter(id__in=entity_ids).values("id", "positive_count", "negative_count")
+    counts = {row["id"]: row for row in rows}
+    user_notations = dict(await model.filter(
+        user_id=user.id, **{f"{fk_field}__in": list(counts)}
+    ).values_list(fk_field, "value")) if counts else {}
+
+    summaries = []
+    for entity_id in dict.fromkeys(entity_ids):
+        if entity_id not in counts:
+            continue
+        positive, negative, user_notation = overlay_buffered_vote(
+            model, user.id, entity_id, counts[entity_id]["positive_count"], counts[entity_id]["negative_count"],
+            user_notations.get(entity_id),
+        )
+        summaries.append({
+            fk_field: entity_id,
+            "positive_notations": positive,
+            "negative_notations": negative,
+            "user_notation": user_notation,
+        })
+    return {"summaries": summaries}, 200
+
+
+async def count_notations(model, entity_ids=None):
+    """Count positive and negative notations per entity with one grouped query.
+    Returns {entity_id: (positive, negative)}, entities without votes are left out."""
+    fk_field = await get_filed_name(model)
+    query = model.all()
+    if entity_ids is not None:
+        query = query.filter(**{f"{fk_field}__in": entity_ids})
+
+    rows = await query.annotate(
+        positive=Count("id", _filter=Q(value=1)),
+        negative=Count("id", _filter=Q(value=-1)),
+    ).group_by(fk_field).values(fk_field, "positive", "negative")
+    return {row[fk_field]: (row["positive"], row["negative"]) for row in rows}
+
+
+async def reconcile_notation_counters(model):
+    """Rebuild the positive/negative counters of every owning entity from the notation table.
+    Returns the number of entities that have votes."""
+    owning_model = await get_owning_model(model)
+
+    async with in_transaction():
+        counts = await count_notations(model)
+        await owning_model.all().update(positive_count=0, negative_count=0)
+        if owning_model is Comment:
+            await owning_model.all().update(score=0)
+        else:
+            await owning_model.all().update(wilson_score=0)
+        for entity_id, (positive, negative) in counts.items():
+            updates = {"positive_count": positive, "negative_count": negative}
+            if owning_model is Comment:
+                updates["score"] = positive - negative
+            await owning_model.filter(id=entity_id).update(**updates)
+        await refresh_wilson_scores(owning_model, list(counts))
+    return len(counts)
@@ -0,0 +1,61 @@
+# Helpers for keyset (cursor) pagination. Pages are fetched by seeking past the last row of the
+# previous page instead of using OFFSET, so every page costs the same whatever its depth.
+# Cursors are opaque to clients: the sort key(s) of the last row, base64 encoded.
+import base64
+import binascii
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200  # hard limit, larger requested limits are clamped
+STREAM_BATCH_SIZE = 500  # rows loaded per query when streaming a full export
+
+
+def encode_cursor(*values):
+    """Encode the sort key(s) of the last row of a page into an opaque cursor."""
+    raw = ":".join(str(v) for v in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size=1):
+    """Decode a cursor made by encode_cursor back into a list of `size` ints. Raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        values = [int(part) for part in raw.split(":")]
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Parse the `limit` query argument, clamped to the server side maximum. Raises ValueError if it is invalid."""
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("Limit must be a positive integer")
+    if limit < 1:
+        raise ValueError("Limit must be a positive integer")
+    return min(limit, maximum)
+
+
+async def fetch_page(query, limit):
+    """Run an ordered query for one page. Returns (rows, has_more)."""
+    # one extra row tells us whether there is a next page without a COUNT query
+    rows = await query.limit(limit + 1)
+    return rows[:limit], len(rows) > limit
+
+
+async def iter_batches(query, batch_size=STREAM_BATCH_SIZE):
+    """Yield all rows of a query in id order, one list of at most batch_size rows at a time.
+    Each batch is its own query seeking past the previous one, so only one batch is held in memory."""
+    last_id = None
+    while True:
+        batch_query = query if last_id is None else query.filter(id__gt=last_id)
+        rows = await batch_query.order_by("id").limit(batch_size)
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1].id
@@ -0,0 +1,43 @@
+# bcrypt takes a few hundred ms per call on purpose. Running it inline in an async handler blocks the
+# IOLoop, and every other request of the process, for that long. The hashing runs in a dedicated
+# thread pool instead (bcrypt releases the GIL), with a cap on the number of waiting jobs so a login
+# storm gets fast 503s instead of an ever growing queue.
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from passlib.hash import bcrypt
+
+load_dotenv()
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "4"))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", "32"))  # jobs allowed to wait for a free worker
+RETRY_AFTER_SECONDS = 1
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="password")
+_in_flight = 0  # running + waiting jobs
+
+
+class PasswordQueueFull(Exception):
+    """Raised when the password pool is saturated; the request should be answered with a 503."""
+
+
+async def _run(func, *args):
+    global _in_flight
+    if _in_flight >= PASSWORD_WORKERS + PASSWORD_QUEUE_LIMIT:
+        raise PasswordQueueFull()
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        _in_flight -= 1
+
+
+async def hash_password(password):
+    """Hash a password with bcrypt without blocking the IOLoop."""
+    return await _run(bcrypt.hash, password)
+
+
+async def verify_password(password, hashed):
+    """Check a password against its bcrypt hash without blocking the IOLoop."""
+    return await _run(bcrypt.verify, password, hashed)
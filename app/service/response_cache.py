@@ -0,0 +1,91 @@
+# In-process cache of rendered GET responses for the heavily polled read endpoints. Each entry is tagged
+# with the entities it shows, e.g. ("feedback", 3) or ("comments", 3) for the comment pages of feedback 3,
+# and the writes invalidate those tags, so a cached body is served (or a 304 answered) without touching the DB.
+# Memory is capped by the total size of the cached bodies, least recently used first out. Every process has
+# its own cache: with several workers a write only invalidates the worker that did it, the TTL bounds how long
+# the others can serve the old body.
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # 0 disables it
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "10"))  # seconds
+
+
+class CachedResponse:
+    __slots__ = ("expires_at", "etag", "body", "tags")
+
+    def __init__(self, expires_at, etag, body, tags):
+        self.expires_at = expires_at
+        self.etag = etag
+        self.body = body
+        self.tags = tags
+
+
+class ResponseCache:
+    """LRU cache of request uri -> (ETag, JSON body), invalidated by tag"""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0  # bytes of all cached bodies
+        self._entries = OrderedDict()  # uri -> CachedResponse
+        self._keys_by_tag = {}  # tag -> uris, for invalidation
+
+    def get(self, key):
+        """Return the CachedResponse of a uri, or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, body, tags):
+        """Cache a JSON body (bytes) under a uri, dropped when any of the tags is invalidated. Returns its ETag."""
+        # same format as Tornado's own ETag, so a client can't tell cached and fresh responses apart
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if len(body) > self.max_bytes:
+            return etag
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = CachedResponse(time.time() + self.ttl, etag, body, tuple(tags))
+        self.size += len(body)
+        for tag in tags:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+        return etag
+
+    def invalidate(self, *tags):
+        """Drop every response showing one of the tags, call it after the write is committed"""
+        for tag in tags:
+            for key in list(self._keys_by_tag.get(tag, ())):
+                self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_tag.clear()
+        self.size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.size -= len(entry.body)
+        for tag in entry.tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL)
@@ -0,0 +1,46 @@
+# Full-text search over feedback notes and comment contents, on the FTS5 index maintained by triggers
+# (see db/migrations.py ensure_search_index), so every write path, imports included, is searchable at once.
+import re
+
+from tortoise import connections
+
+TOKEN_RE = re.compile(r'"([^"]+)"|(\S+)')
+
+
+def search_available():
+    return connections.get("default").capabilities.dialect == "sqlite"
+
+
+def build_match_query(q):
+    """Turn the user's query into an FTS5 MATCH expression: words and "quoted phrases", all required.
+    Every term is quoted, so FTS5 operators and syntax characters in the input are searched as text.
+    Raises ValueError if there is nothing to search."""
+    terms = []
+    for phrase, word in TOKEN_RE.findall(q or ""):
+        term = (phrase or word).strip()
+        if term:
+            terms.append('"%s"' % term.replace('"', '""'))
+    if not terms:
+        raise ValueError("Search query is required")
+    return " ".join(terms)
+
+
+async def search(q, limit, offset=0):
+    """Hits for the query, best bm25 rank first. Returns (hits, has_more)."""
+    match = build_match_query(q)
+    rows = await connections.get("default").execute_query_dict(
+        'SELECT rowid, "feedback_id", snippet("search_index", 0, \'[\', \']\', \'…\', 12) AS "snippet" '
+        'FROM "search_index" WHERE "search_index" MATCH ? ORDER BY rank LIMIT ? OFFSET ?',
+        [match, limit + 1, offset],
+    )
+    hits = [
+        {
+            # rowid is 2*id for a feedback, 2*id+1 for a comment
+            "type": "comment" if row["rowid"] % 2 else "feedback",
+            "id": row["rowid"] // 2,
+            "feedback_id": row["feedback_id"],
+            "snippet": row["snippet"],
+        }
+        for row in rows[:limit]
+    ]
+    return hits, len(rows) > limit
@@ -0,0 +1,56 @@
+# Encoding of the response bodies. JSON goes through orjson when it is installed (several times faster than
+# the stdlib json behind tornado's json_encode, which stays the fallback), and internal clients can ask for
+# MessagePack with `Accept: application/msgpack` when msgpack is installed. Both are optional:
+#     pip install orjson msgpack
+from tornado.escape import json_encode
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_CONTENT_TYPE = "application/json; charset=UTF-8"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = {"application/msgpack", "application/x-msgpack", "application/vnd.msgpack"}
+
+
+def encode_json(data):
+    """JSON body of a response, as bytes"""
+    if orjson is not None:
+        # int keys are written as strings, like the stdlib does
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json_encode(data).encode()
+
+
+def encode_msgpack(data):
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def accepts_msgpack(accept):
+    """True when an Accept header lists a MessagePack media type (not with q=0)"""
+    for media_range in (accept or "").split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        if media_type.lower() not in MSGPACK_MEDIA_TYPES:
+            continue
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def negotiate(accept):
+    """(content type, encoder) of the responses to a request with this Accept header.
+    MessagePack when the client asks for it and msgpack is installed, JSON otherwise."""
+    if msgpack is not None and accepts_msgpack(accept):
+        return MSGPACK_CONTENT_TYPE, encode_msgpack
+    return JSON_CONTENT_TYPE, encode_json
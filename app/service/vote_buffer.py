@@ -0,0 +1,74 @@
+# Optional write-behind mode for notation writes (VOTE_WRITE_BEHIND=true). PUT votes are kept in memory,
+# one entry per (notation model, user, entity) so repeated toggles collapse into the last value, and
+# notation_service.flush_votes writes them to the DB in batched transactions every VOTE_FLUSH_INTERVAL_MS
+# or as soon as VOTE_BUFFER_MAX_SIZE votes are waiting. Buffered votes are lost if the process is killed
+# without a chance to flush (SIGKILL, crash); SIGTERM/SIGINT flush them, in production mode the parent
+# forwards them to every worker, see app/main.py.
+import os
+
+from dotenv import load_dotenv
+from tornado.ioloop import PeriodicCallback
+
+load_dotenv()
+VOTE_WRITE_BEHIND = os.getenv("VOTE_WRITE_BEHIND", "false").lower() == "true"
+VOTE_FLUSH_INTERVAL_MS = int(os.getenv("VOTE_FLUSH_INTERVAL_MS", "200"))
+VOTE_BUFFER_MAX_SIZE = int(os.getenv("VOTE_BUFFER_MAX_SIZE", "5000"))  # votes, a flush starts when reached
+
+
+class VoteBuffer:
+    """Votes waiting to be written: (model, user_id, entity_id) -> value"""
+
+    def __init__(self, enabled, max_size, flush_interval_ms):
+        self.enabled = enabled
+        self.max_size = max_size
+        self.flush_interval_ms = flush_interval_ms
+        self._pending = {}
+        self._flushing = {}  # taken by the flush in progress, not committed yet
+        self._periodic = None
+
+    def add(self, model, user_id, entity_id, value):
+        """Buffer a vote, replacing the user's previous buffered vote on the entity.
+        Returns True when the buffer is full and should be flushed now."""
+        self._pending[model, user_id, entity_id] = value
+        return len(self._pending) >= self.max_size
+
+    def get(self, model, user_id, entity_id):
+        """The user's vote on the entity that is not in the DB yet, or None"""
+        key = (model, user_id, entity_id)
+        if key in self._pending:
+            return self._pending[key]
+        return self._flushing.get(key)
+
+    def discard(self, model, user_id, entity_id):
+        """Forget a buffered vote, for writes that go straight to the DB and supersede it.
+        Also dropped from the flush in progress, so a failed flush can't put it back over the newer vote."""
+        self._pending.pop((model, user_id, entity_id), None)
+        self._flushing.pop((model, user_id, entity_id), None)
+
+    def take(self):
+        """Move the pending votes to the flush in progress and return them"""
+        self._flushing, self._pending = self._pending, {}
+        return self._flushing
+
+    def done(self, failed=False):
+        """End the flush in progress. Failed votes go back to pending, unless the user voted again since."""
+        if failed:
+            self._pending = {**self._flushing, **self._pending}
+        self._flushing = {}
+
+    def start(self, flush):
+        """Call the `flush` coroutine function every flush interval, on the current IOLoop"""
+        if self.enabled and self._periodic is None:
+            self._periodic = PeriodicCallback(flush, self.flush_interval_ms)
+            self._periodic.start()
+
+    def stop(self):
+        if self._periodic is not None:
+            self._periodic.stop()
+            self._periodic = None
+
+    def __len__(self):
+        return len(self._pending)
+
+
+vote_buffer = VoteBuffer(VOTE_WRITE_BEHIND, VOTE_BUFFER_MAX_SIZE, VOTE_FLUSH_INTERVAL_MS)
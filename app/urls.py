@@ -2,27 +2,49 @@
 
 from app.handlers.comment_handler import CommentHandler, SingleCommentHandler, FeedbackCommentsHandler
 from app.handlers.comment_notation_handler import CommentNotationHandler
-from app.handlers.feedback_handler import FeedbackHandler
+from app.handlers.feedback_handler import FeedbackHandler, FeedbackStatsHandler, TopFeedbackHandler
 from app.handlers.feedback_notation_handler import FeedBackNotationHandler
 from app.handlers.health_handler import HealthCheckHandler
+from app.handlers.import_handler import FeedbackImportHandler, CommentImportHandler
+from app.handlers.metrics_handler import MetricsHandler
+from app.handlers.notation_batch_handler import NotationBatchHandler
+from app.handlers.notation_stream_handler import NotationStreamHandler
+from app.handlers.notation_summaries_handler import FeedbackNotationSummariesHandler, CommentNotationSummariesHandler
+from app.handlers.search_handler import SearchHandler
 from app.handlers.user_handler import RegisterHandler, LoginHandler
 
 urlpatterns = [
     (r"/", HealthCheckHandler),
+    (r"/metrics", MetricsHandler),  # Prometheus
     (r"/api/register", RegisterHandler),
     (r"/api/login", LoginHandler),
     (r"/api/feedback", FeedbackHandler),
     (r"/api/feedback/([0-9]+)", FeedbackHandler),
+    (r"/api/feedback/import", FeedbackImportHandler),  # NDJSON body
+    (r"/api/feedback/stats", FeedbackStatsHandler),  # ?user_id=
+    (r"/api/feedback/top", TopFeedbackHandler),  # ?limit=
     (r"/api/comment", CommentHandler),
     (r"/api/comment/([0-9]+)", SingleCommentHandler),  # comment_id
+    (r"/api/comment/import", CommentImportHandler),  # NDJSON body
     (r"/api/feedback/([0-9]+)/comments", FeedbackCommentsHandler),  # feedback_id
     # Feedback notations
     (r"/api/feedback/([0-9]+)/notations", FeedBackNotationHandler),
     (r"/api/feedback/([0-9]+)/notations/summary", FeedBackNotationHandler),
+    (r"/api/feedback/notations/summary", FeedbackNotationSummariesHandler),  # ?ids=1,2,3
 
     # Comment notations
     (r"/api/comment/([0-9]+)/notations", CommentNotationHandler),
     (r"/api/comment/([0-9]+)/notations/summary", CommentNotationHandler),
+    (r"/api/comment/notations/summary", CommentNotationSummariesHandler),  # ?ids=1,2,3
+
+    # Many notations of any entity type at once
+    (r"/api/notations/batch", NotationBatchHandler),
+
+    # Live notation counts (Server-Sent Events)
+    (r"/api/notations/stream", NotationStreamHandler),  # ?feedback=1,2&comment=3
+
+    # Full-text search over feedback notes and comments
+    (r"/api/search", SearchHandler),  # ?q=
 ]
 
 
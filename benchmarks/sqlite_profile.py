@@ -0,0 +1,103 @@
+# benchmarks/sqlite_profile.py
+# Write throughput and read latency of the SQLite connection profiles under concurrent load.
+# Every writer and reader is its own process with its own connection, like the production workers:
+#     python -m benchmarks.sqlite_profile --seconds 5 --writers 4 --readers 4
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from tortoise import Tortoise
+from tortoise.exceptions import OperationalError
+
+from app.models import User, Feedback
+from db.init_db import SQLITE_PROFILES, sqlite_config
+
+SEED_FEEDBACKS = 10000
+
+# what a plain SQLite connection gets, to compare against
+PROFILES = {"sqlite-defaults": {"journal_mode": "DELETE", "synchronous": "FULL"}, **SQLITE_PROFILES}
+
+
+async def seed(db_path, pragmas):
+    await Tortoise.init(config=sqlite_config(db_path, pragmas))
+    await Tortoise.generate_schemas()
+    user = await User.create(username="bench", password="x")
+    await Feedback.bulk_create(
+        [Feedback(user_id=user.id, rating=random.randint(1, 5), note="seed") for _ in range(SEED_FEEDBACKS)],
+        batch_size=1000,
+    )
+    await Tortoise.close_connections()
+
+
+async def load(role, db_path, pragmas, seconds):
+    """Run one kind of operation in a loop; returns (role, operations, errors, latencies)"""
+    await Tortoise.init(config=sqlite_config(db_path, pragmas))
+    operations, errors, latencies = 0, 0, []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if role == "writer":
+                # one committed insert per vote/feedback, as the handlers do
+                await Feedback.create(user_id=1, rating=random.randint(1, 5), note="benchmark")
+            else:
+                await Feedback.filter(id=random.randint(1, SEED_FEEDBACKS)).first().values(
+                    "positive_count", "negative_count"
+                )
+        except OperationalError:  # database is locked
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        operations += 1
+    await Tortoise.close_connections()
+    return role, operations, errors, latencies
+
+
+def run_load(role, db_path, pragmas, seconds):
+    return asyncio.run(load(role, db_path, pragmas, seconds))
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+def bench_profile(name, pragmas, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.sqlite3")
+        asyncio.run(seed(db_path, pragmas))
+
+        jobs = [("writer", db_path, pragmas, args.seconds)] * args.writers
+        jobs += [("reader", db_path, pragmas, args.seconds)] * args.readers
+        with multiprocessing.get_context("spawn").Pool(len(jobs)) as pool:
+            results = pool.starmap(run_load, jobs)
+
+    writes = sum(ops for role, ops, _, _ in results if role == "writer")
+    errors = sum(err for _, _, err, _ in results)
+    reads = [lat * 1000 for role, _, _, lats in results if role == "reader" for lat in lats]
+    print(f"{name:<16} {writes / args.seconds:>10.0f} {len(reads) / args.seconds:>10.0f} "
+          f"{percentile(reads, 50):>9.2f} {percentile(reads, 99):>9.2f} {errors:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SQLite connection profiles")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--profiles", nargs="*", default=list(PROFILES))
+    args = parser.parse_args()
+
+    print(f"{args.writers} writer and {args.readers} reader processes, {args.seconds}s per profile")
+    print(f"{'profile':<16} {'writes/s':>10} {'reads/s':>10} {'read p50':>9} {'read p99':>9} {'locked':>7}")
+    for name in args.profiles:
+        bench_profile(name, PROFILES[name], args)
+
+
+if __name__ == "__main__":
+    main()
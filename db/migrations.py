@@ -0,0 +1,169 @@
+import logging
+
+from tortoise import connections
+from tortoise.exceptions import OperationalError
+
+from app.models import FeedbackNotation, CommentNotation
+from app.service.feedback_service import rebuild_rating_stats
+from app.service.notation_service import reconcile_notation_counters
+
+# generate_schemas(safe=True) only creates missing tables and indexes, it never alters existing tables.
+# Columns added to existing models are listed here so older databases get them on startup.
+ADDED_COLUMNS = [
+    ("feedback", "positive_count", "INT NOT NULL DEFAULT 0"),
+    ("feedback", "negative_count", "INT NOT NULL DEFAULT 0"),
+    ("comment", "positive_count", "INT NOT NULL DEFAULT 0"),
+    ("comment", "negative_count", "INT NOT NULL DEFAULT 0"),
+    ("comment", "score", "INT NOT NULL DEFAULT 0"),
+    ("feedback", "wilson_score", "REAL NOT NULL DEFAULT 0"),
+]
+
+# columns that are derived from the notation tables and need a counter rebuild when added
+COUNTER_COLUMNS = {"positive_count", "negative_count", "score", "wilson_score"}
+
+# Changes that can't be expressed as a missing column (constraints, data fixes) run once per database
+# and are recorded in this table. A database created from scratch by generate_schemas already has
+# them all, so they are only recorded there.
+MIGRATIONS_TABLE = "schema_migration"
+
+
+async def table_exists(connection, table):
+    try:
+        await connection.execute_query(f'SELECT 1 FROM "{table}" LIMIT 0')
+    except OperationalError:
+        return False
+    return True
+
+
+async def column_exists(connection, table, column):
+    # the column is qualified with the table, otherwise SQLite reads an unknown "column" as a string literal
+    try:
+        await connection.execute_query(f'SELECT "{table}"."{column}" FROM "{table}" LIMIT 0')
+    except OperationalError:
+        return False
+    return True
+
+
+async def is_new_database():
+    """True before generate_schemas created the tables of a brand new database"""
+    return not await table_exists(connections.get("default"), "feedback")
+
+
+async def add_missing_columns():
+    """Add new columns to the tables of an existing database. Runs before generate_schemas,
+    because the indexes it creates may cover the new columns. Returns the added "table.column" names."""
+    connection = connections.get("default")
+
+    added = []
+    for table, column, definition in ADDED_COLUMNS:
+        # a missing table is created complete by generate_schemas
+        if await table_exists(connection, table) and not await column_exists(connection, table, column):
+            await connection.execute_script(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {definition}')
+            added.append(f"{table}.{column}")
+
+    if added:
+        logging.info("Added columns: %s", ", ".join(added))
+    return added
+
+
+async def backfill(added_columns):
+    """Fill the data of the columns added by add_missing_columns. Runs after generate_schemas."""
+    if any(name.split(".")[1] in COUNTER_COLUMNS for name in added_columns):
+        # the new counters start at 0, rebuild them from the existing votes
+        for model in (FeedbackNotation, CommentNotation):
+            await reconcile_notation_counters(model)
+
+
+async def unique_notations(connection):
+    """Enforce one notation per user and entity on databases created before the unique constraints."""
+    for table, fk in (("feedbacknotation", "feedback_id"), ("commentnotation", "comment_id")):
+        # keep the latest vote when a user voted twice on the same entity
+        await connection.execute_script(
+            f'DELETE FROM "{table}" WHERE "id" NOT IN '
+            f'(SELECT MAX("id") FROM "{table}" GROUP BY "user_id", "{fk}")'
+        )
+        await connection.execute_script(
+            f'CREATE UNIQUE INDEX IF NOT EXISTS "uid_{table}_user_id_{fk}" ON "{table}" ("user_id", "{fk}")'
+        )
+    # the removed duplicates were counted
+    for model in (FeedbackNotation, CommentNotation):
+        await reconcile_notation_counters(model)
+
+
+async def rating_stats(connection):
+    """Fill the rating statistics table (created empty by generate_schemas) from the existing feedbacks."""
+    await rebuild_rating_stats()
+
+
+MIGRATIONS = [
+    ("0001_unique_notations", unique_notations),
+    ("0002_rating_stats", rating_stats),
+]
+
+
+async def run_migrations(new_database):
+    """Apply the MIGRATIONS not yet recorded in the database. Runs after generate_schemas."""
+    connection = connections.get("default")
+    await connection.execute_script(
+        f'CREATE TABLE IF NOT EXISTS "{MIGRATIONS_TABLE}" ("name" VARCHAR(100) NOT NULL PRIMARY KEY)'
+    )
+    _, rows = await connection.execute_query(f'SELECT "name" FROM "{MIGRATIONS_TABLE}"')
+    applied = {row[0] for row in rows}
+
+    for name, migration in MIGRATIONS:
+        if name in applied:
+            continue
+        if not new_database:
+            logging.info("Applying migration %s", name)
+            await migration(connection)
+        # names are constants of this module, no need for dialect specific placeholders
+        await connection.execute_script(f"INSERT INTO \"{MIGRATIONS_TABLE}\" (\"name\") VALUES ('{name}')")
+
+
+# Full-text index of feedback notes and comment contents (SQLite FTS5, other backends have no search).
+# Rowids are derived from the entity id (feedback 2*id, comment 2*id+1) so the triggers keeping it in
+# sync find their row by rowid, and feedback_id is stored with every row for the links in the results.
+SEARCH_TABLE = "search_index"
+SEARCH_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS "feedback_search_insert" AFTER INSERT ON "feedback" WHEN new."note" IS NOT NULL
+    BEGIN INSERT INTO "search_index" (rowid, "body", "feedback_id") VALUES (new."id" * 2, new."note", new."id"); END""",
+    """CREATE TRIGGER IF NOT EXISTS "feedback_search_update" AFTER UPDATE OF "note" ON "feedback"
+    BEGIN DELETE FROM "search_index" WHERE rowid = old."id" * 2;
+    INSERT INTO "search_index" (rowid, "body", "feedback_id")
+    SELECT new."id" * 2, new."note", new."id" WHERE new."note" IS NOT NULL; END""",
+    """CREATE TRIGGER IF NOT EXISTS "feedback_search_delete" AFTER DELETE ON "feedback"
+    BEGIN DELETE FROM "search_index" WHERE rowid = old."id" * 2; END""",
+    """CREATE TRIGGER IF NOT EXISTS "comment_search_insert" AFTER INSERT ON "comment"
+    BEGIN INSERT INTO "search_index" (rowid, "body", "feedback_id")
+    VALUES (new."id" * 2 + 1, new."content", new."feedback_id"); END""",
+    """CREATE TRIGGER IF NOT EXISTS "comment_search_update" AFTER UPDATE OF "content", "feedback_id" ON "comment"
+    BEGIN DELETE FROM "search_index" WHERE rowid = old."id" * 2 + 1;
+    INSERT INTO "search_index" (rowid, "body", "feedback_id")
+    VALUES (new."id" * 2 + 1, new."content", new."feedback_id"); END""",
+    """CREATE TRIGGER IF NOT EXISTS "comment_search_delete" AFTER DELETE ON "comment"
+    BEGIN DELETE FROM "search_index" WHERE rowid = old."id" * 2 + 1; END""",
+]
+
+
+async def ensure_search_index():
+    """Create the full-text index and its triggers if missing, indexing the existing rows when it is new.
+    Runs after generate_schemas on every start, does nothing on other backends than SQLite."""
+    connection = connections.get("default")
+    if connection.capabilities.dialect != "sqlite":
+        return
+    if not await table_exists(connection, SEARCH_TABLE):
+        await connection.execute_script(
+            f'CREATE VIRTUAL TABLE "{SEARCH_TABLE}" USING fts5("body", "feedback_id" UNINDEXED, '
+            "tokenize='porter unicode61 remove_diacritics 2')"
+        )
+        await connection.execute_script(
+            f'INSERT INTO "{SEARCH_TABLE}" (rowid, "body", "feedback_id") '
+            'SELECT "id" * 2, "note", "id" FROM "feedback" WHERE "note" IS NOT NULL'
+        )
+        await connection.execute_script(
+            f'INSERT INTO "{SEARCH_TABLE}" (rowid, "body", "feedback_id") '
+            'SELECT "id" * 2 + 1, "content", "feedback_id" FROM "comment"'
+        )
+        logging.info("Created the full-text search index")
+    for trigger in SEARCH_TRIGGERS:
+        await connection.execute_script(trigger)
@@ -0,0 +1,27 @@
+# db/reconcile_counters.py
+# Rebuilds the denormalized notation counters on Feedback and Comment from the notation tables,
+# and the rating statistics from the feedback table.
+# Run it after manual edits to the database: python -m db.reconcile_counters
+import logging
+
+from tortoise import run_async
+
+from app.models import FeedbackNotation, CommentNotation
+from app.service.feedback_service import rebuild_rating_stats
+from app.service.notation_service import reconcile_notation_counters
+from db.init_db import init_db
+
+logging.basicConfig(level=logging.INFO)
+
+
+async def main():
+    await init_db()
+    for model in (FeedbackNotation, CommentNotation):
+        count = await reconcile_notation_counters(model)
+        logging.info("Reconciled %s counters for %d entities", model.__name__, count)
+    count = await rebuild_rating_stats()
+    logging.info("Rebuilt the rating statistics of %d users", count)
+
+
+if __name__ == "__main__":
+    run_async(main())
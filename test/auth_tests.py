@@ -0,0 +1,178 @@
+# test/auth_tests.py
+import asyncio
+import datetime
+import json
+from unittest import mock
+
+import jwt
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application
+
+from app.handlers.base_auth_handler import BaseAuthHandler, SECRET_KEY, rejects_deleted_user
+from app.models import User, Feedback
+from app.service.auth_cache import auth_cache
+from test.db_test_config import init_inmemory_db, close_inmemory_db
+
+
+class WhoAmIHandler(BaseAuthHandler):
+    async def get(self):
+        self.require_auth()
+        self.write({"id": self.current_user.id, "username": self.current_user.username})
+
+
+class ClaimsOnlyHandler(BaseAuthHandler):
+    load_user = False
+
+    async def get(self):
+        self.require_auth()
+        response = {"id": self.current_user.id}
+        if self.get_argument("full", None):
+            user = await self.load_current_user()
+            response["password"] = user.password
+        self.write(response)
+
+    @rejects_deleted_user
+    async def post(self):
+        self.require_auth()
+        feedback = await Feedback.create(user_id=self.current_user.id, note="claims only", rating=3)
+        self.write({"id": feedback.id})
+
+
+class TestBaseAuthHandlerIntegration(AsyncHTTPTestCase):
+    user = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(cls.loop)
+        cls.loop.run_until_complete(init_inmemory_db())
+        cls.user = cls.loop.run_until_complete(
+            User.create(username="authuser", password="hashedpw")
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.run_until_complete(close_inmemory_db())
+        cls.loop.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        auth_cache.clear()
+
+    def get_app(self):
+        return Application([
+            (r"/whoami", WhoAmIHandler),
+            (r"/claims", ClaimsOnlyHandler),
+        ])
+
+    def _generate_token(self, user, expires_in=datetime.timedelta(hours=1)):
+        payload = {
+            "sub": str(user.id),
+            "username": user.username,
+            "exp": datetime.datetime.utcnow() + expires_in
+        }
+        return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
+
+    async def _whoami(self, token):
+        return await self.http_client.fetch(
+            self.get_url("/whoami"),
+            method="GET",
+            headers={"Authorization": f"Bearer {token}"},
+            raise_error=False
+        )
+
+    @gen_test
+    async def test_repeated_token_skips_user_query(self):
+        token = self._generate_token(self.user)
+        response = await self._whoami(token)
+        self.assertEqual(response.code, 200)
+
+        with mock.patch.object(User, "get_or_none", side_effect=AssertionError("user was queried")):
+            response = await self._whoami(token)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(json.loads(response.body)["username"], "authuser")
+
+    @gen_test
+    async def test_user_change_invalidates_cache(self):
+        user = await User.create(username="renamed_before", password="pw")
+        token = self._generate_token(user)
+        await self._whoami(token)
+
+        user.username = "renamed_after"
+        await user.save()
+
+        response = await self._whoami(token)
+        self.assertEqual(json.loads(response.body)["username"], "renamed_after")
+
+    @gen_test
+    async def test_expired_token_is_not_served_from_cache(self):
+        token = self._generate_token(self.user, expires_in=datetime.timedelta(seconds=-1))
+        response = await self._whoami(token)
+        self.assertEqual(response.code, 401)
+        self.assertEqual(len(auth_cache), 0)
+
+    @gen_test
+    async def test_claims_only_handler_skips_user_query(self):
+        token = self._generate_token(self.user)
+        with mock.patch.object(User, "get_or_none", side_effect=AssertionError("user was queried")):
+            response = await self.http_client.fetch(
+                self.get_url("/claims"),
+                method="GET",
+                headers={"Authorization": f"Bearer {token}"},
+                raise_error=False
+            )
+        self.assertEqual(response.code, 200)
+        self.assertEqual(json.loads(response.body), {"id": self.user.id})
+
+    @gen_test
+    async def test_claims_only_handler_loads_user_on_demand(self):
+        token = self._generate_token(self.user)
+        response = await self.http_client.fetch(
+            self.get_url("/claims?full=1"),
+            method="GET",
+            headers={"Authorization": f"Bearer {token}"},
+            raise_error=False
+        )
+        self.assertEqual(response.code, 200)
+        self.assertEqual(json.loads(response.body)["password"], "hashedpw")
+
+    @gen_test
+    async def test_claims_only_handler_requires_token(self):
+        response = await self.http_client.fetch(self.get_url("/claims"), method="GET", raise_error=False)
+        self.assertEqual(response.code, 401)
+
+    async def _post_claims(self, token):
+        return await self.http_client.fetch(
+            self.get_url("/claims"),
+            method="POST",
+            body="",
+            headers={"Authorization": f"Bearer {token}"},
+            raise_error=False
+        )
+
+    @gen_test
+    async def test_claims_only_handler_rejects_deleted_user(self):
+        user = await User.create(username="deleted_here", password="pw")
+        token = self._generate_token(user)
+        self.assertEqual((await self._post_claims(token)).code, 200)
+
+        await user.delete()
+
+        with mock.patch.object(User, "exists", side_effect=AssertionError("user was queried")):
+            response = await self._post_claims(token)
+        self.assertEqual(response.code, 401)
+
+    @gen_test
+    async def test_claims_only_write_of_user_deleted_elsewhere(self):
+        user = await User.create(username="deleted_elsewhere", password="pw")
+        token = self._generate_token(user)
+        self.assertEqual((await self._post_claims(token)).code, 200)
+        await Feedback.filter(user_id=user.id).delete()
+
+        await User.filter(id=user.id).delete()  # no signal, like a delete made by another process
+
+        response = await self._post_claims(token)
+        self.assertEqual(response.code, 401)
+        self.assertTrue(auth_cache.is_deleted(user.id))
@@ -6,7 +6,8 @@ from tornado.web import Application
 from tornado.testing import AsyncHTTPTestCase, gen_test
 import jwt
 
-from app.models import User, Feedback, Comment
+from app.models import User, Feedback, Comment, CommentNotation
+from app.service.notation_service import create_notation
 from app.handlers.comment_handler import CommentHandler, SingleCommentHandler, FeedbackCommentsHandler
 from app.handlers.base_auth_handler import SECRET_KEY
 from test.db_test_config import init_inmemory_db, close_inmemory_db
@@ -106,6 +107,21 @@ class TestCommentHandlerIntegration(AsyncHTTPTestCase):
         data = json.loads(response.body)
         self.assertEqual(data["error"], "Comment content is required")
 
+    @gen_test
+    async def test_create_comment_with_numeric_string_feedback_id(self):
+        token = self._generate_token(self.user)
+        body = json.dumps({"content": "Id as a string", "feedback_id": str(self.feedback.id)})
+        response = await self.http_client.fetch(
+            self.get_url("/comments"),
+            method="POST",
+            body=body,
+            headers={"Authorization": f"Bearer {token}"},
+            raise_error=False
+        )
+        self.assertEqual(response.code, 201)
+        comment = await Comment.get(id=json.loads(response.body)["id"])
+        self.assertEqual(comment.feedback_id, self.feedback.id)
+
     @gen_test
     async def test_create_comment_feedback_not_found(self):
         token = self._generate_token(self.user)
@@ -188,4 +204,77 @@ class TestCommentHandlerIntegration(AsyncHTTPTestCase):
         )
         self.assertEqual(response.code, 404)
         data = json.loads(response.body)
-        self.assertEqual(data["error"], "Feedback not found")
\ No newline at end of file
+        self.assertEqual(data["error"], "Feedback not found")
+
+    @gen_test
+    async def test_get_comments_sorted_by_score_with_pages(self):
+        feedback = await Feedback.create(user=self.user, note="Scored feedback", rating=4)
+        voters = [await User.create(username=f"voter{i}", password="pw") for i in range(2)]
+        low = await Comment.create(user=self.user, feedback=feedback, content="low")
+        high = await Comment.create(user=self.user, feedback=feedback, content="high")
+        mid = await Comment.create(user=self.user, feedback=feedback, content="mid")
+        tie = await Comment.create(user=self.user, feedback=feedback, content="mid too")
+        await create_notation(CommentNotation, voters[0], low.id, -1)
+        for voter in voters:
+            await create_notation(CommentNotation, voter, high.id, 1)
+        await create_notation(CommentNotation, voters[0], mid.id, 1)
+        await create_notation(CommentNotation, voters[1], tie.id, 1)
+
+        seen = []
+        url = self.get_url(f"/feedback/{feedback.id}/comments?sort=score&limit=2")
+        while url:
+            response = await self.http_client.fetch(url, method="GET", raise_error=False)
+            self.assertEqual(response.code, 200)
+            data = json.loads(response.body)
+            seen.extend(c["id"] for c in data["comments"])
+            cursor = data["next_cursor"]
+            url = self.get_url(f"/feedback/{feedback.id}/comments?sort=score&limit=2&after={cursor}") if cursor else None
+
+        # highest score first, newest first on ties
+        self.assertEqual(seen, [high.id, tie.id, mid.id, low.id])
+
+    @gen_test
+    async def test_get_comments_newest_first(self):
+        feedback = await Feedback.create(user=self.user, note="Ordered feedback", rating=4)
+        first = await Comment.create(user=self.user, feedback=feedback, content="first")
+        second = await Comment.create(user=self.user, feedback=feedback, content="second")
+
+        response = await self.http_client.fetch(
+            self.get_url(f"/feedback/{feedback.id}/comments?sort=newest&limit=1"),
+            method="GET",
+            raise_error=False
+        )
+        data = json.loads(response.body)
+        self.assertEqual([c["id"] for c in data["comments"]], [second.id])
+
+        response = await self.http_client.fetch(
+            self.get_url(f"/feedback/{feedback.id}/comments?sort=newest&limit=1&after={data['next_cursor']}"),
+            method="GET",
+            raise_error=False
+        )
+        data = json.loads(response.body)
+        self.assertEqual([c["id"] for c in data["comments"]], [first.id])
+        self.assertIsNone(data["next_cursor"])
+
+    @gen_test
+    async def test_get_comments_invalid_sort(self):
+        response = await self.http_client.fetch(
+            self.get_url(f"/feedback/{self.feedback.id}/comments?sort=random"),
+            method="GET",
+            raise_error=False
+        )
+        self.assertEqual(response.code, 400)
+
+    @gen_test
+    async def test_stream_comments_for_feedback(self):
+        feedback = await Feedback.create(user=self.user, note="Streamed feedback", rating=4)
+        comments = [await Comment.create(user=self.user, feedback=feedback, content=f"c{i}") for i in range(3)]
+
+        response = await self.http_client.fetch(
+            self.get_url(f"/feedback/{feedback.id}/comments?stream=true"),
+            method="GET",
+            raise_error=False
+        )
+        self.assertEqual(response.code, 200)
+        data = json.loads(response.body)
+        self.assertEqual([c["id"] for c in data["comments"]], [c.id for c in comments])
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import json
 
@@ -5,12 +6,16 @@ import json
 import jwt
 from tornado.testing import AsyncHTTPTestCase, gen_test
 from tornado.web import Application
-from tortoise import Tortoise
 
 from app.handlers.base_auth_handler import SECRET_KEY
 from app.handlers.feedback_notation_handler import FeedBackNotationHandler
+from app.handlers.notation_summaries_handler import FeedbackNotationSummariesHandler
 from app.models import User, Feedback, FeedbackNotation
-from test.db_test_config import init_inmemory_db
+from app.service.notation_service import (
+    create_notation, update_notation, set_notation, reconcile_notation_counters, wilson_score
+)
+from app.service.metrics import start_timings
+from test.db_test_config import init_inmemory_db, close_inmemory_db, reset_db_lock
 
 
 class TestFeedBackNotationHandlerIntegration(AsyncHTTPTestCase):
@@ -29,13 +34,14 @@ class TestFeedBackNotationHandlerIntegration(AsyncHTTPTestCase):
 
     @classmethod
     def tearDownClass(cls):
-        cls.loop.run_until_complete(Tortoise.close_connections())
+        cls.loop.run_until_complete(close_inmemory_db())
         cls.loop.close()
         super().tearDownClass()
 
     def get_app(self):
         return Application([
             (r"/feedback/([0-9]+)/notations", FeedBackNotationHandler),
+            (r"/feedback/notations/summary", FeedbackNotationSummariesHandler),
         ])
 
     async def _create_feedback(self):
@@ -196,10 +202,10 @@ class TestFeedBackNotationHandlerIntegration(AsyncHTTPTestCase):
         feedback = await self._create_feedback()
         token = self._generate_token(self.user)
 
-        # create notations
-        await FeedbackNotation.create(user=self.user, feedback=feedback, value=1)
+        # create notations through the service so the counters are maintained
+        await create_notation(FeedbackNotation, self.user, feedback.id, 1)
         another_user = await User.create(username="otheruser", password="pw")
-        await FeedbackNotation.create(user=another_user, feedback=feedback, value=-1)
+        await create_notation(FeedbackNotation, another_user, feedback.id, -1)
 
         response = await self.http_client.fetch(
             self.get_url(f"/feedback/{feedback.id}/notations"),
@@ -232,3 +238,203 @@ class TestFeedBackNotationHandlerIntegration(AsyncHTTPTestCase):
         self.assertEqual(data["positive_notations"], 0)
         self.assertEqual(data["negative_notations"], 0)
         self.assertEqual(data["user_notation"], 0)
+
+    ## counters
+
+    @gen_test
+    async def test_counters_follow_vote_changes(self):
+        feedback = await self._create_feedback()
+        token = self._generate_token(self.user)
+
+        await self.http_client.fetch(
+            self.get_url(f"/feedback/{feedback.id}/notations"),
+            method="POST",
+            body=json.dumps({"value": -1}),
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        await feedback.refresh_from_db()
+        self.assertEqual((feedback.positive_count, feedback.negative_count), (0, 1))
+
+        # -1 -> +1 moves the vote from one counter to the other
+        await self.http_client.fetch(
+            self.get_url(f"/feedback/{feedback.id}/notations"),
+            method="PATCH",
+            body=json.dumps({"value": 1}),
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        await feedback.refresh_from_db()
+        self.assertEqual((feedback.positive_count, feedback.negative_count), (1, 0))
+
+        self.assertGreater(feedback.wilson_score, 0)  # the stored rank follows the counters
+
+        await update_notation(FeedbackNotation, self.user, feedback.id, 0)
+        await feedback.refresh_from_db()
+        self.assertEqual((feedback.positive_count, feedback.negative_count), (0, 0))
+        self.assertEqual(feedback.wilson_score, 0)
+
+    @gen_test
+    async def test_post_notation_feedback_not_found(self):
+        token = self._generate_token(self.user)
+        response = await self.http_client.fetch(
+            self.get_url("/feedback/999999/notations"),
+            method="POST",
+            body=json.dumps({"value": 1}),
+            headers={"Authorization": f"Bearer {token}"},
+            raise_error=False
+        )
+        self.assertEqual(response.code, 404)
+
+    @gen_test
+    async def test_reconcile_rebuilds_counters(self):
+        feedback = await self._create_feedback()
+        another_user = await User.create(username="reconcileuser", password="pw")
+        # rows written behind the service's back leave the counters stale
+        await FeedbackNotation.create(user=self.user, feedback=feedback, value=1)
+        await FeedbackNotation.create(user=another_user, feedback=feedback, value=1)
+
+        await reconcile_notation_counters(FeedbackNotation)
+
+        await feedback.refresh_from_db()
+        self.assertEqual((feedback.positive_count, feedback.negative_count), (2, 0))
+        self.assertAlmostEqual(feedback.wilson_score, wilson_score(2, 0))
+
+    @gen_test
+    async def test_post_second_notation_rejected(self):
+        feedback = await self._create_feedback()
+        token = self._generate_token(self.user)
+
+        responses = []
+        for value in (1, -1):
+            responses.append(await self.http_client.fetch(
+                self.get_url(f"/feedback/{feedback.id}/notations"),
+                method="POST",
+                body=json.dumps({"value": value}),
+                headers={"Authorization": f"Bearer {token}"},
+                raise_error=False
+            ))
+
+        self.assertEqual([r.code for r in responses], [201, 400])
+        self.assertEqual(await FeedbackNotation.filter(feedback_id=feedback.id).count(), 1)
+        # the rejected vote did not touch the counters
+        await feedback.refresh_from_db()
+        self.assertEqual((feedback.positive_count, feedback.negative_count), (1, 0))
+
+    ## upsert
+
+    @gen_test
+    async def test_put_creates_then_replaces_notation(self):
+        feedback = await self._create_feedback()
+        token = self._generate_token(self.user)
+
+        # the same request works for the first vote and for every change after it
+        responses = []
+        for value in (1, -1, -1):
+            responses.append(await self.http_client.fetch(
+                self.get_url(f"/feedback/{feedback.id}/notations"),
+                method="PUT",
+                body=json.dumps({"value": value}),
+                headers={"Authorization": f"Bearer {token}"},
+            ))
+
+        self.assertEqual([r.code for r in responses], [200, 200, 200])
+        self.assertEqual(json.loads(responses[-1].body)["content"], -1)
+        notations = await FeedbackNotation.filter(feedback_id=feedback.id).values_list("value", flat=True)
+        self.assertEqual(notations, [-1])
+        await feedback.refresh_from_db()
+        self.assertEqual((feedback.positive_count, feedback.negative_count), (0, 1))
+
+    @gen_test
+    async def test_concurrent_first_puts_of_one_user_are_counted_once(self):
+        reset_db_lock()
+        feedback = await self._create_feedback()
+        voter = await User.create(username="putracer", password="pw")
+
+        # both first votes would read "no previous vote" without the entity lock, and both count
+        results = await asyncio.gather(*(set_notation(FeedbackNotation, voter, feedback.id, 1) for _ in range(2)))
+
+        self.assertEqual([status for _, status in results], [200, 200])
+        await feedback.refresh_from_db()
+        self.assertEqual((feedback.positive_count, feedback.negative_count), (1, 0))
+        self.assertEqual(await FeedbackNotation.filter(feedback_id=feedback.id).count(), 1)
+
+    @gen_test
+    async def test_put_statements(self):
+        feedback = await self._create_feedback()
+
+        # locking read of the counters and the old vote, counters UPDATE, vote upsert
+        timings = start_timings()
+        await set_notation(FeedbackNotation, self.user, feedback.id, 1)
+        self.assertEqual(timings.db_queries, 3)
+
+        timings = start_timings()  # the same vote again, nothing to write
+        await set_notation(FeedbackNotation, self.user, feedback.id, 1)
+        self.assertEqual(timings.db_queries, 1)
+
+        await feedback.refresh_from_db()
+        self.assertEqual((feedback.positive_count, feedback.negative_count), (1, 0))
+        self.assertAlmostEqual(feedback.wilson_score, wilson_score(1, 0))
+
+    @gen_test
+    async def test_concurrent_patches_keep_the_counters_right(self):
+        reset_db_lock()
+        feedback = await self._create_feedback()
+        voter = await User.create(username="patchracer", password="pw")
+        await create_notation(FeedbackNotation, voter, feedback.id, 1)
+
+        # both PATCHes would compute their delta from the old +1 without the entity lock
+        results = await asyncio.gather(
+            update_notation(FeedbackNotation, voter, feedback.id, -1),
+            update_notation(FeedbackNotation, voter, feedback.id, 0),
+        )
+
+        self.assertEqual([status for _, status in results], [200, 200])
+        await feedback.refresh_from_db()
+        self.assertEqual((feedback.positive_count, feedback.negative_count), (0, 0))
+
+    @gen_test
+    async def test_put_feedback_not_found(self):
+        token = self._generate_token(self.user)
+        response = await self.http_client.fetch(
+            self.get_url("/feedback/999999/notations"),
+            method="PUT",
+            body=json.dumps({"value": 1}),
+            headers={"Authorization": f"Bearer {token}"},
+            raise_error=False
+        )
+        self.assertEqual(response.code, 404)
+        self.assertFalse(await FeedbackNotation.filter(feedback_id=999999).exists())
+
+    ## summaries of many feedbacks
+
+    @gen_test
+    async def test_get_many_summaries(self):
+        first = await self._create_feedback()
+        second = await self._create_feedback()
+        another_user = await User.create(username="summariesuser", password="pw")
+        await create_notation(FeedbackNotation, self.user, first.id, 1)
+        await create_notation(FeedbackNotation, another_user, first.id, 1)
+        await create_notation(FeedbackNotation, another_user, second.id, -1)
+        token = self._generate_token(self.user)
+
+        response = await self.http_client.fetch(
+            self.get_url(f"/feedback/notations/summary?ids={second.id},{first.id},999999"),
+            headers={"Authorization": f"Bearer {token}"},
+        )
+
+        self.assertEqual(response.code, 200)
+        # request order, the unknown id is left out
+        self.assertEqual(json.loads(response.body)["summaries"], [
+            {"feedback_id": second.id, "positive_notations": 0, "negative_notations": 1, "user_notation": 0},
+            {"feedback_id": first.id, "positive_notations": 2, "negative_notations": 0, "user_notation": 1},
+        ])
+
+    @gen_test
+    async def test_get_many_summaries_invalid_ids(self):
+        token = self._generate_token(self.user)
+        for query in ("", "?ids=1,abc", "?ids=" + ",".join(["1"] * 201)):
+            response = await self.http_client.fetch(
+                self.get_url("/feedback/notations/summary" + query),
+                headers={"Authorization": f"Bearer {token}"},
+                raise_error=False
+            )
+            self.assertEqual(response.code, 400)
@@ -0,0 +1,141 @@
+# test/import_tests.py
+import datetime
+import json
+from unittest import mock
+
+import jwt
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application
+
+from app.handlers import import_handler
+from app.handlers.base_auth_handler import SECRET_KEY
+from app.handlers.import_handler import FeedbackImportHandler, CommentImportHandler
+from app.models import User, Feedback, Comment
+from app.service.feedback_service import get_rating_stats
+from test.db_test_config import init_inmemory_db, close_inmemory_db
+
+
+class TestImportHandlerIntegration(AsyncHTTPTestCase):
+    user = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import asyncio
+        cls.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(cls.loop)
+        cls.loop.run_until_complete(init_inmemory_db())
+        cls.user = cls.loop.run_until_complete(
+            User.create(username="importer", password="hashedpw")
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.run_until_complete(close_inmemory_db())
+        cls.loop.close()
+        super().tearDownClass()
+
+    def get_app(self):
+        return Application([
+            (r"/feedback/import", FeedbackImportHandler),
+            (r"/comment/import", CommentImportHandler),
+        ])
+
+    def _generate_token(self, user):
+        payload = {
+            "sub": str(user.id),
+            "username": user.username,
+            "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        }
+        return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
+
+    async def _import(self, path, chunks, user=None):
+        """POST the body in several writes, like a client streaming a large file"""
+        async def body_producer(write):
+            for chunk in chunks:
+                await write(chunk.encode())
+
+        return await self.http_client.fetch(
+            self.get_url(path),
+            method="POST",
+            body_producer=body_producer,
+            headers={"Authorization": f"Bearer {self._generate_token(user or self.user)}"},
+            raise_error=False
+        )
+
+    @gen_test
+    async def test_import_feedback(self):
+        before = await Feedback.filter(user_id=self.user.id).count()
+        rated_before = (await get_rating_stats(self.user.id))["count"]
+        lines = [json.dumps({"note": f"Imported {i}", "rating": i % 5 + 1}) for i in range(7)]
+        lines.insert(3, json.dumps({"note": "Bad rating", "rating": 9}))
+        lines.insert(5, "{not json")
+        body = "\n".join(lines)  # no trailing newline
+
+        # records split across writes and several bulk inserts
+        with mock.patch.object(import_handler, "IMPORT_CHUNK_SIZE", 3):
+            response = await self._import("/feedback/import", [body[:50], body[50:51], body[51:]])
+
+        self.assertEqual(response.code, 200)
+        data = json.loads(response.body)
+        self.assertEqual((data["accepted"], data["rejected"]), (7, 2))
+        self.assertEqual(data["errors"], [
+            {"line": 4, "error": "Rating must be an integer between 1 and 5"},
+            {"line": 6, "error": "Invalid JSON"},
+        ])
+        self.assertEqual(await Feedback.filter(user_id=self.user.id).count(), before + 7)
+        self.assertEqual((await get_rating_stats(self.user.id))["count"], rated_before + 7)
+
+    @gen_test
+    async def test_import_comments_checks_feedbacks(self):
+        feedback = await Feedback.create(user=self.user, note="Import target", rating=3)
+        body = "\n".join([
+            json.dumps({"feedback_id": feedback.id, "content": "First"}),
+            json.dumps({"feedback_id": 999999, "content": "Orphan"}),
+            json.dumps({"feedback_id": feedback.id}),
+            json.dumps({"feedback_id": feedback.id, "content": "Second"}),
+        ]) + "\n"
+
+        response = await self._import("/comment/import", [body])
+
+        data = json.loads(response.body)
+        self.assertEqual((data["accepted"], data["rejected"]), (2, 2))
+        self.assertEqual(sorted(e["line"] for e in data["errors"]), [2, 3])
+        contents = await Comment.filter(feedback_id=feedback.id).order_by("id").values_list("content", flat=True)
+        self.assertEqual(contents, ["First", "Second"])
+
+    @gen_test
+    async def test_import_rejects_too_long_line(self):
+        body = "\n".join([
+            json.dumps({"note": "x" * 200, "rating": 1}),
+            json.dumps({"note": "short", "rating": 2}),
+        ])
+
+        with mock.patch.object(import_handler, "IMPORT_MAX_LINE_SIZE", 100):
+            response = await self._import("/feedback/import", [body[:60], body[60:150], body[150:]])
+
+        data = json.loads(response.body)
+        self.assertEqual((data["accepted"], data["rejected"]), (1, 1))
+        self.assertEqual(data["errors"], [{"line": 1, "error": "Line is too long"}])
+
+    @gen_test
+    async def test_import_missing_auth(self):
+        response = await self.http_client.fetch(
+            self.get_url("/feedback/import"),
+            method="POST",
+            body=json.dumps({"note": "No auth", "rating": 3}),
+            raise_error=False
+        )
+        self.assertEqual(response.code, 401)
+
+    @gen_test
+    async def test_import_of_deleted_user(self):
+        user = await User.create(username="deleted_importer", password="pw")
+        await User.filter(id=user.id).delete()  # no signal, like a delete made by another process
+        body = "\n".join(json.dumps({"note": f"Orphan {i}", "rating": 3}) for i in range(3)) + "\n"
+
+        # the first chunk is inserted while the body is still being received
+        with mock.patch.object(import_handler, "IMPORT_CHUNK_SIZE", 1):
+            response = await self._import("/feedback/import", [body], user=user)
+
+        self.assertEqual(response.code, 401)
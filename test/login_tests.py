@@ -2,11 +2,11 @@ import json
 import asyncio
 import datetime
 import unittest
+from unittest import mock
 
 import tornado
 from tornado.web import Application
 from tornado.testing import AsyncHTTPTestCase, gen_test
-from tortoise import Tortoise
 
 from passlib.hash import bcrypt
 import jwt
@@ -14,7 +14,8 @@ import jwt
 from app.models import User
 from app.handlers.user_handler import LoginHandler  # adjust import path
 from app.handlers.user_handler import SECRET_KEY     # import your secret key
-from test.db_test_config import init_inmemory_db
+from app.service import password_service
+from test.db_test_config import init_inmemory_db, close_inmemory_db
 
 
 
@@ -32,7 +33,7 @@ class TestLoginHandlerIntegration(AsyncHTTPTestCase):
 
     @classmethod
     def tearDownClass(cls):
-        cls.loop.run_until_complete(Tortoise.close_connections())
+        cls.loop.run_until_complete(close_inmemory_db())
         cls.loop.close()
         super().tearDownClass()
 
@@ -109,3 +110,20 @@ class TestLoginHandlerIntegration(AsyncHTTPTestCase):
         self.assertEqual(response.code, 400)
         data = json.loads(response.body)
         self.assertEqual(data["error"], "Username and password required")
+
+    @gen_test
+    async def test_login_password_pool_full(self):
+        await User.create(username="busyuser", password=bcrypt.hash("secret"))
+
+        body = json.dumps({"username": "busyuser", "password": "secret"})
+        with mock.patch.object(password_service, "PASSWORD_WORKERS", 0), \
+                mock.patch.object(password_service, "PASSWORD_QUEUE_LIMIT", 0):
+            response = await self.http_client.fetch(
+                self.get_url("/login"),
+                method="POST",
+                body=body,
+                raise_error=False
+            )
+
+        self.assertEqual(response.code, 503)
+        self.assertEqual(response.headers["Retry-After"], str(password_service.RETRY_AFTER_SECONDS))
@@ -0,0 +1,144 @@
+# test/metrics_tests.py
+import asyncio
+import json
+import unittest
+
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application
+
+from app.handlers.feedback_handler import FeedbackHandler
+from app.handlers.metrics_handler import MetricsHandler
+from app.models import User, Feedback
+from app.service.metrics import Metrics, Timings, metrics, start_timings, timed_db_call
+from test.db_test_config import init_inmemory_db, close_inmemory_db
+
+
+def parse_server_timing(value):
+    """{metric name: duration in ms}"""
+    timings = {}
+    for metric in value.split(","):
+        name, duration = metric.strip().split(";dur=")
+        timings[name] = float(duration)
+    return timings
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render_counts_and_cumulative_buckets(self):
+        registry = Metrics()
+        timings = Timings()
+        timings.db, timings.db_queries = 0.003, 2
+        registry.record("FeedbackHandler", "GET", 200, 0.004, timings)
+        registry.record("FeedbackHandler", "GET", 201, 0.2)
+        registry.record("FeedbackHandler", "GET", 404, 20)
+
+        text = registry.render()
+
+        self.assertIn('smartflow_http_requests_total{handler="FeedbackHandler",method="GET",status="2xx"} 2', text)
+        self.assertIn('smartflow_http_requests_total{handler="FeedbackHandler",method="GET",status="4xx"} 1', text)
+        labels = 'handler="FeedbackHandler",method="GET"'
+        self.assertIn(f'smartflow_http_request_duration_seconds_bucket{{{labels},le="0.005"}} 1', text)
+        self.assertIn(f'smartflow_http_request_duration_seconds_bucket{{{labels},le="0.25"}} 2', text)
+        self.assertIn(f'smartflow_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3', text)
+        self.assertIn(f'smartflow_http_request_duration_seconds_count{{{labels}}} 3', text)
+        self.assertIn(f'smartflow_http_request_phase_seconds_bucket{{{labels},phase="db",le="0.0025"}} 0', text)
+        self.assertIn(f'smartflow_http_request_phase_seconds_bucket{{{labels},phase="db",le="0.005"}} 1', text)
+        self.assertIn(f'smartflow_db_queries_total{{{labels}}} 2', text)
+
+    def test_server_timing_in_milliseconds(self):
+        timings = Timings()
+        timings.auth, timings.db = 0.0005, 0.0123
+        self.assertEqual(
+            parse_server_timing(timings.server_timing(0.02)),
+            {"auth": 0.5, "db": 12.3, "serialize": 0.0, "total": 20.0},
+        )
+
+    def test_concurrent_queries_are_all_counted_and_timed_once(self):
+        class Client:
+            @timed_db_call
+            async def execute_query(self, delay):
+                await asyncio.sleep(delay)
+
+            @timed_db_call
+            async def execute_query_dict(self, delay):
+                await self.execute_query(delay)  # delegates, still one query
+
+        async def request():
+            timings = start_timings()
+            client = Client()
+            await asyncio.gather(client.execute_query(0.05), client.execute_query_dict(0.05))
+            await client.execute_query(0.01)
+            return timings
+
+        loop = asyncio.new_event_loop()
+        try:
+            timings = loop.run_until_complete(request())
+        finally:
+            loop.close()
+        self.assertEqual(timings.db_queries, 3)
+        self.assertGreaterEqual(timings.db, 0.06)
+        self.assertLess(timings.db, 0.1)  # the overlap of the gathered queries is counted once
+
+
+class TestMetricsIntegration(AsyncHTTPTestCase):
+    user = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(cls.loop)
+        cls.loop.run_until_complete(init_inmemory_db())
+        cls.user = cls.loop.run_until_complete(
+            User.create(username="metricsuser", password="hashedpw")
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.run_until_complete(close_inmemory_db())
+        cls.loop.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        metrics.clear()
+
+    def get_app(self):
+        return Application([
+            (r"/feedback", FeedbackHandler),
+            (r"/metrics", MetricsHandler),
+        ])
+
+    @gen_test
+    async def test_requests_are_timed_and_exposed(self):
+        await Feedback.create(user=self.user, note="Measured", rating=4)
+
+        response = await self.http_client.fetch(self.get_url("/feedback"))
+        self.assertEqual(len(json.loads(response.body)["feedbacks"]), 1)
+        server_timing = parse_server_timing(response.headers["Server-Timing"])
+        self.assertEqual(set(server_timing), {"auth", "db", "serialize", "total"})
+        self.assertGreater(server_timing["db"], 0)  # the page query went through the instrumented client
+        self.assertGreaterEqual(server_timing["total"], server_timing["db"])
+
+        response = await self.http_client.fetch(self.get_url("/feedback"), method="POST", body="{}", raise_error=False)
+        self.assertEqual(response.code, 401)
+        self.assertIn("Server-Timing", response.headers)  # errors are timed too
+
+        response = await self.http_client.fetch(self.get_url("/metrics"))
+        self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+        text = response.body.decode()
+        self.assertIn('smartflow_http_requests_total{handler="FeedbackHandler",method="GET",status="2xx"} 1', text)
+        self.assertIn('smartflow_http_requests_total{handler="FeedbackHandler",method="POST",status="4xx"} 1', text)
+        self.assertIn('smartflow_db_queries_total{handler="FeedbackHandler",method="GET"} 1', text)
+
+    @gen_test
+    async def test_unknown_methods_share_one_label(self):
+        for method in ("FOO", "BAZ"):
+            response = await self.http_client.fetch(
+                self.get_url("/feedback"), method=method, allow_nonstandard_methods=True, raise_error=False
+            )
+            self.assertEqual(response.code, 405)
+
+        text = (await self.http_client.fetch(self.get_url("/metrics"))).body.decode()
+        self.assertIn('smartflow_http_requests_total{handler="FeedbackHandler",method="other",status="4xx"} 2', text)
+        self.assertNotIn('method="FOO"', text)
@@ -0,0 +1,147 @@
+# test/notation_batch_tests.py
+import asyncio
+import datetime
+import json
+
+import jwt
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application
+
+from app.handlers.base_auth_handler import SECRET_KEY
+from app.handlers.notation_batch_handler import NotationBatchHandler
+from app.models import User, Feedback, Comment, FeedbackNotation, CommentNotation
+from app.service.notation_service import set_notations, wilson_score
+from test.db_test_config import init_inmemory_db, close_inmemory_db
+
+
+class TestNotationBatchHandlerIntegration(AsyncHTTPTestCase):
+    user = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import asyncio
+        cls.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(cls.loop)
+        cls.loop.run_until_complete(init_inmemory_db())
+        cls.user = cls.loop.run_until_complete(
+            User.create(username="batchuser", password="hashedpw")
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.run_until_complete(close_inmemory_db())
+        cls.loop.close()
+        super().tearDownClass()
+
+    def get_app(self):
+        return Application([
+            (r"/notations/batch", NotationBatchHandler),
+        ])
+
+    def _generate_token(self, user):
+        payload = {
+            "sub": str(user.id),
+            "username": user.username,
+            "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        }
+        return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
+
+    async def _post_batch(self, items):
+        return await self.http_client.fetch(
+            self.get_url("/notations/batch"),
+            method="POST",
+            body=json.dumps(items),
+            headers={"Authorization": f"Bearer {self._generate_token(self.user)}"},
+            raise_error=False
+        )
+
+    @gen_test
+    async def test_batch_sets_votes_and_counters(self):
+        feedbacks = [await Feedback.create(user=self.user, note=f"Batch {i}", rating=4) for i in range(3)]
+        comment = await Comment.create(user=self.user, feedback=feedbacks[0], content="Batch comment")
+        # an existing vote is replaced, not duplicated
+        await FeedbackNotation.create(user=self.user, feedback=feedbacks[0], value=-1)
+        await Feedback.filter(id=feedbacks[0].id).update(negative_count=1)
+
+        response = await self._post_batch([
+            {"entity_type": "feedback", "entity_id": feedbacks[0].id, "value": 1},
+            {"entity_type": "feedback", "entity_id": feedbacks[1].id, "value": -1},
+            {"entity_type": "feedback", "entity_id": feedbacks[2].id, "value": 1},
+            {"entity_type": "comment", "entity_id": comment.id, "value": 1},
+        ])
+
+        self.assertEqual(response.code, 200)
+        results = json.loads(response.body)["results"]
+        self.assertEqual([r["status"] for r in results], [200, 200, 200, 200])
+        self.assertEqual([r["content"] for r in results], [1, -1, 1, 1])
+
+        counters = [
+            await Feedback.get(id=fb.id).values_list("positive_count", "negative_count", "wilson_score")
+            for fb in feedbacks
+        ]
+        self.assertEqual(counters, [(1, 0, wilson_score(1, 0)), (0, 1, 0), (1, 0, wilson_score(1, 0))])
+        self.assertEqual(await FeedbackNotation.filter(feedback_id=feedbacks[0].id).count(), 1)
+        await comment.refresh_from_db()
+        self.assertEqual((comment.positive_count, comment.score), (1, 1))
+        self.assertEqual(await CommentNotation.filter(comment_id=comment.id).values_list("value", flat=True), [1])
+
+    @gen_test
+    async def test_batch_reports_invalid_and_missing_items(self):
+        feedback = await Feedback.create(user=self.user, note="Partly valid", rating=3)
+
+        response = await self._post_batch([
+            {"entity_type": "feedback", "entity_id": feedback.id, "value": 5},
+            {"entity_type": "photo", "entity_id": feedback.id, "value": 1},
+            {"entity_type": "feedback", "entity_id": 999999, "value": 1},
+            {"entity_type": "feedback", "entity_id": feedback.id, "value": 1},
+        ])
+
+        self.assertEqual(response.code, 200)
+        results = json.loads(response.body)["results"]
+        self.assertEqual([r["status"] for r in results], [400, 400, 404, 200])
+        self.assertEqual(results[0]["error"], "Notation must be -1, 0 or 1")
+        await feedback.refresh_from_db()
+        self.assertEqual((feedback.positive_count, feedback.negative_count), (1, 0))
+
+    @gen_test
+    async def test_batch_last_vote_for_an_entity_wins(self):
+        feedback = await Feedback.create(user=self.user, note="Changed my mind", rating=2)
+
+        response = await self._post_batch([
+            {"entity_type": "feedback", "entity_id": feedback.id, "value": 1},
+            {"entity_type": "feedback", "entity_id": feedback.id, "value": -1},
+        ])
+
+        self.assertEqual(response.code, 200)
+        self.assertEqual(await FeedbackNotation.filter(feedback_id=feedback.id).values_list("value", flat=True), [-1])
+        await feedback.refresh_from_db()
+        self.assertEqual((feedback.positive_count, feedback.negative_count), (0, 1))
+
+    @gen_test
+    async def test_concurrent_batches_count_first_votes_once_each(self):
+        feedbacks = [await Feedback.create(user=self.user, note=f"Raced {i}", rating=3) for i in range(2)]
+        voters = [await User.create(username=f"batchracer{i}", password="pw") for i in range(2)]
+        # the entities are listed in different orders, the locks are still taken in id order
+        items = [{"entity_type": "feedback", "entity_id": fb.id, "value": 1} for fb in feedbacks]
+
+        results = await asyncio.gather(set_notations(voters[0], items), set_notations(voters[1], items[::-1]))
+
+        self.assertEqual([r["status"] for batch in results for r in batch], [200] * 4)
+        counters = [await Feedback.get(id=fb.id).values_list("positive_count", "negative_count") for fb in feedbacks]
+        self.assertEqual(counters, [(2, 0), (2, 0)])
+
+    @gen_test
+    async def test_batch_rejects_non_array_body(self):
+        response = await self._post_batch({"entity_type": "feedback", "entity_id": 1, "value": 1})
+        self.assertEqual(response.code, 400)
+
+    @gen_test
+    async def test_batch_missing_auth(self):
+        response = await self.http_client.fetch(
+            self.get_url("/notations/batch"),
+            method="POST",
+            body=json.dumps([]),
+            raise_error=False
+        )
+        self.assertEqual(response.code, 401)
@@ -0,0 +1,163 @@
+# test/notation_stream_tests.py
+import asyncio
+import json
+
+from tornado.httpclient import HTTPClientError
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application
+
+import app.handlers.notation_stream_handler as notation_stream_handler
+from app.handlers.notation_stream_handler import NotationStreamHandler
+from app.models import User, Feedback, Comment, FeedbackNotation, CommentNotation
+from app.service.notation_events import NotationEvents, notation_events
+from app.service.notation_service import create_notation, update_notation
+from test.db_test_config import init_inmemory_db, close_inmemory_db
+
+
+def parse_events(chunks):
+    """data of the `summary` events received so far"""
+    events = []
+    for block in b"".join(chunks).decode().split("\n\n"):
+        lines = block.split("\n")
+        if lines[0] == "event: summary" and len(lines) > 1:
+            events.append(json.loads(lines[1][len("data: "):]))
+    return events
+
+
+class TestNotationStreamHandlerIntegration(AsyncHTTPTestCase):
+    user = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(cls.loop)
+        cls.loop.run_until_complete(init_inmemory_db())
+        cls.user = cls.loop.run_until_complete(
+            User.create(username="streamuser", password="hashedpw")
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.run_until_complete(close_inmemory_db())
+        cls.loop.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self._tick = notation_stream_handler.SSE_TICK_MS
+        notation_stream_handler.SSE_TICK_MS = 20
+
+    def tearDown(self):
+        notation_stream_handler.SSE_TICK_MS = self._tick
+        super().tearDown()
+
+    def get_app(self):
+        return Application([
+            (r"/notations/stream", NotationStreamHandler),
+        ])
+
+    async def _wait_for(self, condition, timeout=2):
+        for _ in range(int(timeout / 0.01)):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        self.fail("condition not met in time")
+
+    @gen_test(timeout=10)
+    async def test_stream_sends_counts_then_changes(self):
+        other = await User.create(username="streamvoter", password="pw")
+        feedback = await Feedback.create(user=self.user, note="Live", rating=4)
+        comment = await Comment.create(user=self.user, feedback=feedback, content="Live comment")
+        chunks = []
+        response = self.http_client.fetch(
+            self.get_url(f"/notations/stream?feedback={feedback.id}&comment={comment.id}"),
+            streaming_callback=chunks.append,
+            request_timeout=1,
+            raise_error=False,
+        )
+
+        # the current counts of every subscribed entity first
+        await self._wait_for(lambda: len(parse_events(chunks)) == 2)
+        self.assertEqual(
+            sorted((e["entity_type"], e["id"], e["positive_notations"]) for e in parse_events(chunks)),
+            [("comment", comment.id, 0), ("feedback", feedback.id, 0)],
+        )
+
+        await create_notation(FeedbackNotation, self.user, feedback.id, 1)
+        await create_notation(FeedbackNotation, other, feedback.id, -1)
+        await update_notation(FeedbackNotation, other, feedback.id, 1)
+
+        def latest_feedback_counts():
+            events = [e for e in parse_events(chunks) if e["entity_type"] == "feedback"]
+            return events[-1]["positive_notations"], events[-1]["negative_notations"]
+
+        await self._wait_for(lambda: latest_feedback_counts() == (2, 0))
+        # only the changed entity is sent again
+        self.assertEqual(len([e for e in parse_events(chunks) if e["entity_type"] == "comment"]), 1)
+
+        await create_notation(CommentNotation, other, comment.id, -1)
+        await self._wait_for(lambda: parse_events(chunks)[-1]["entity_type"] == "comment")
+        self.assertEqual(parse_events(chunks)[-1]["negative_notations"], 1)
+
+        with self.assertRaises(HTTPClientError):
+            await response  # the client gives up after request_timeout
+        await self._wait_for(lambda: len(notation_events) == 0)  # and its subscription is dropped
+
+    @gen_test(timeout=10)
+    async def test_stream_sends_votes_of_other_workers(self):
+        feedback = await Feedback.create(user=self.user, note="Elsewhere", rating=4)
+        chunks = []
+        response = self.http_client.fetch(
+            self.get_url(f"/notations/stream?feedback={feedback.id}"),
+            streaming_callback=chunks.append,
+            request_timeout=1,
+            raise_error=False,
+        )
+        await self._wait_for(lambda: len(parse_events(chunks)) == 1)
+
+        # a vote written by another process changes the counters without publishing anything here
+        await Feedback.filter(id=feedback.id).update(positive_count=3)
+
+        await self._wait_for(lambda: parse_events(chunks)[-1]["positive_notations"] == 3)
+        self.assertEqual(len(parse_events(chunks)), 2)
+        with self.assertRaises(HTTPClientError):
+            await response
+
+    @gen_test
+    async def test_stream_requires_ids(self):
+        response = await self.http_client.fetch(self.get_url("/notations/stream"), raise_error=False)
+        self.assertEqual(response.code, 400)
+
+        response = await self.http_client.fetch(self.get_url("/notations/stream?feedback=1,x"), raise_error=False)
+        self.assertEqual(response.code, 400)
+
+
+class TestNotationEvents(AsyncHTTPTestCase):
+    def get_app(self):
+        return Application([])
+
+    @gen_test
+    async def test_changes_are_coalesced_per_entity(self):
+        events = NotationEvents()
+        subscription = events.subscribe([("feedback", 1), ("feedback", 2)])
+
+        for _ in range(100):
+            events.publish("feedback", [1])
+        events.publish("feedback", ["2", 3])  # 3 is not subscribed
+
+        self.assertEqual(await subscription.wait(1), {("feedback", 1), ("feedback", 2)})
+        self.assertEqual(await subscription.wait(0.01), set())
+
+        events.unsubscribe(subscription)
+        self.assertTrue(subscription.closed)
+        self.assertEqual(len(events), 0)
+
+    def test_close_all_ends_every_subscription(self):
+        events = NotationEvents()
+        subscriptions = [events.subscribe([("comment", 1)]), events.subscribe([("comment", 1), ("feedback", 1)])]
+
+        events.close_all()
+
+        self.assertTrue(all(subscription.closed for subscription in subscriptions))
+        self.assertEqual(len(events), 0)
@@ -4,12 +4,11 @@ import unittest
 
 from tornado.web import Application
 from tornado.testing import AsyncHTTPTestCase, gen_test
-from tortoise import Tortoise
 from tortoise.contrib.test import initializer, finalizer
 
 from app.handlers.user_handler import RegisterHandler
 from app.models import User
-from test.db_test_config import init_inmemory_db
+from test.db_test_config import init_inmemory_db, close_inmemory_db
 
 
 class TestRegisterHandlerIntegration(AsyncHTTPTestCase):
@@ -23,7 +22,7 @@ class TestRegisterHandlerIntegration(AsyncHTTPTestCase):
 
     @classmethod
     def tearDownClass(cls):
-        cls.loop.run_until_complete(Tortoise.close_connections())
+        cls.loop.run_until_complete(close_inmemory_db())
         cls.loop.close()
         super().tearDownClass()
 
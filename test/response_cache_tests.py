@@ -0,0 +1,135 @@
+# test/response_cache_tests.py
+import datetime
+import json
+import unittest
+
+import jwt
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application
+
+from app.handlers.base_auth_handler import SECRET_KEY
+from app.handlers.comment_handler import CommentHandler, SingleCommentHandler, FeedbackCommentsHandler
+from app.handlers.feedback_handler import FeedbackHandler
+from app.models import User, Feedback, Comment, CommentNotation
+from app.service.notation_service import set_notation
+from app.service.response_cache import ResponseCache
+from test.db_test_config import init_inmemory_db, close_inmemory_db
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used_over_max_bytes(self):
+        cache = ResponseCache(max_bytes=10, ttl=60)
+        cache.put("/a", b"aaaa", [("feedback", 1)])
+        cache.put("/b", b"bbbb", [("feedback", 2)])
+        cache.get("/a")  # /b is now the least recently used
+        cache.put("/c", b"cccc", [("feedback", 3)])
+
+        self.assertIsNotNone(cache.get("/a"))
+        self.assertIsNone(cache.get("/b"))
+        self.assertEqual(cache.size, 8)
+
+    def test_invalidate_drops_every_response_with_the_tag(self):
+        cache = ResponseCache(max_bytes=1000, ttl=60)
+        cache.put("/feedback/1/comments", b"[]", [("comments", 1)])
+        cache.put("/feedback/1/comments?sort=score", b"[]", [("comments", 1)])
+        cache.put("/feedback/2/comments", b"[]", [("comments", 2)])
+
+        cache.invalidate(("comments", 1))
+
+        self.assertEqual(len(cache), 1)
+        self.assertIsNotNone(cache.get("/feedback/2/comments"))
+
+    def test_expired_entry_is_a_miss(self):
+        cache = ResponseCache(max_bytes=1000, ttl=0)
+        cache.put("/feedback/1", b"{}", [("feedback", 1)])
+        self.assertIsNone(cache.get("/feedback/1"))
+
+
+class TestCachedHandlersIntegration(AsyncHTTPTestCase):
+    user = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import asyncio
+        cls.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(cls.loop)
+        cls.loop.run_until_complete(init_inmemory_db())
+        cls.user = cls.loop.run_until_complete(
+            User.create(username="cacheuser", password="hashedpw")
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.run_until_complete(close_inmemory_db())
+        cls.loop.close()
+        super().tearDownClass()
+
+    def get_app(self):
+        return Application([
+            (r"/feedback/([0-9]+)", FeedbackHandler),
+            (r"/comments", CommentHandler),
+            (r"/comments/([0-9]+)", SingleCommentHandler),
+            (r"/feedback/([0-9]+)/comments", FeedbackCommentsHandler),
+        ])
+
+    def _generate_token(self, user):
+        payload = {
+            "sub": str(user.id),
+            "username": user.username,
+            "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        }
+        return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
+
+    async def _get(self, path, **headers):
+        return await self.http_client.fetch(self.get_url(path), headers=headers, raise_error=False)
+
+    @gen_test
+    async def test_repeat_get_is_served_from_cache(self):
+        feedback = await Feedback.create(user=self.user, note="Cached", rating=4)
+        first = await self._get(f"/feedback/{feedback.id}")
+        # a change behind the handlers' back is not seen, the body comes from the cache
+        await Feedback.filter(id=feedback.id).update(note="Changed")
+        second = await self._get(f"/feedback/{feedback.id}")
+
+        self.assertEqual(second.code, 200)
+        self.assertEqual(json.loads(second.body)["note"], "Cached")
+        self.assertEqual(first.headers["Etag"], second.headers["Etag"])
+
+    @gen_test
+    async def test_if_none_match_gets_304(self):
+        feedback = await Feedback.create(user=self.user, note="Polled", rating=3)
+        comment = await Comment.create(user=self.user, feedback=feedback, content="Polled comment")
+        for path in (f"/feedback/{feedback.id}", f"/comments/{comment.id}", f"/feedback/{feedback.id}/comments"):
+            first = await self._get(path)
+            again = await self._get(path, **{"If-None-Match": first.headers["Etag"]})
+            self.assertEqual(again.code, 304, path)
+            self.assertEqual(again.body, b"")
+
+    @gen_test
+    async def test_new_comment_invalidates_comment_pages(self):
+        feedback = await Feedback.create(user=self.user, note="Discussed", rating=5)
+        await self._get(f"/feedback/{feedback.id}/comments")
+
+        await self.http_client.fetch(
+            self.get_url("/comments"),
+            method="POST",
+            body=json.dumps({"content": "Fresh", "feedback_id": feedback.id}),
+            headers={"Authorization": f"Bearer {self._generate_token(self.user)}"},
+            raise_error=False
+        )
+        response = await self._get(f"/feedback/{feedback.id}/comments")
+
+        self.assertEqual([c["content"] for c in json.loads(response.body)["comments"]], ["Fresh"])
+
+    @gen_test
+    async def test_vote_invalidates_comment_pages(self):
+        feedback = await Feedback.create(user=self.user, note="Voted on", rating=2)
+        comment = await Comment.create(user=self.user, feedback=feedback, content="Vote me")
+        await self._get(f"/feedback/{feedback.id}/comments?sort=score")
+
+        await set_notation(CommentNotation, self.user, comment.id, 1)
+        response = await self._get(f"/feedback/{feedback.id}/comments?sort=score")
+
+        self.assertEqual(json.loads(response.body)["comments"][0]["score"], 1)
@@ -0,0 +1,126 @@
+# test/search_tests.py
+import json
+from urllib.parse import urlencode
+
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application
+
+from app.handlers.search_handler import SearchHandler, MAX_SEARCH_OFFSET
+from app.service.pagination import encode_cursor
+from app.models import User, Feedback, Comment
+from app.service.search_service import build_match_query
+from test.db_test_config import init_inmemory_db, close_inmemory_db
+
+
+class TestSearchHandlerIntegration(AsyncHTTPTestCase):
+    user = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import asyncio
+        cls.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(cls.loop)
+        cls.loop.run_until_complete(init_inmemory_db())
+        cls.user = cls.loop.run_until_complete(
+            User.create(username="searchuser", password="hashedpw")
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.run_until_complete(close_inmemory_db())
+        cls.loop.close()
+        super().tearDownClass()
+
+    def get_app(self):
+        return Application([
+            (r"/search", SearchHandler),
+        ])
+
+    async def _search(self, **params):
+        response = await self.http_client.fetch(
+            self.get_url("/search?" + urlencode(params)), raise_error=False
+        )
+        return response, json.loads(response.body)
+
+    @gen_test
+    async def test_search_finds_feedbacks_and_comments(self):
+        feedback = await Feedback.create(user=self.user, note="The checkout page is painfully slow", rating=2)
+        comment = await Comment.create(user=self.user, feedback=feedback, content="Checkout crashed for me too")
+        await Feedback.create(user=self.user, note="Lovely colours", rating=5)
+
+        response, data = await self._search(q="checkout")
+
+        self.assertEqual(response.code, 200)
+        found = {(hit["type"], hit["id"]) for hit in data["hits"]}
+        self.assertEqual(found, {("feedback", feedback.id), ("comment", comment.id)})
+        self.assertTrue(all(hit["feedback_id"] == feedback.id for hit in data["hits"]))
+        self.assertTrue(all("[" in hit["snippet"] for hit in data["hits"]))  # matched term highlighted
+        self.assertIsNone(data["next_cursor"])
+
+    @gen_test
+    async def test_search_stems_and_requires_all_terms(self):
+        feedback = await Feedback.create(user=self.user, note="Exporting invoices takes ages", rating=2)
+        await Feedback.create(user=self.user, note="Exporting reports works fine", rating=4)
+
+        _, data = await self._search(q="export invoice")
+
+        self.assertEqual([hit["id"] for hit in data["hits"]], [feedback.id])
+
+    @gen_test
+    async def test_search_follows_updates_and_deletes(self):
+        feedback = await Feedback.create(user=self.user, note="Typo in the footer", rating=3)
+        feedback.note = "Misspelling in the header"
+        await feedback.save()
+
+        _, data = await self._search(q="footer")
+        self.assertEqual(data["hits"], [])
+        _, data = await self._search(q="misspelling")
+        self.assertEqual([hit["id"] for hit in data["hits"]], [feedback.id])
+
+        await feedback.delete()
+        _, data = await self._search(q="misspelling")
+        self.assertEqual(data["hits"], [])
+
+    @gen_test
+    async def test_search_paginates(self):
+        for i in range(5):
+            await Feedback.create(user=self.user, note=f"Pagination sample {i}", rating=3)
+
+        _, first = await self._search(q="pagination", limit=3)
+        _, second = await self._search(q="pagination", limit=3, after=first["next_cursor"])
+
+        self.assertEqual(len(first["hits"]), 3)
+        self.assertEqual(len(second["hits"]), 2)
+        self.assertIsNone(second["next_cursor"])
+        ids = [hit["id"] for hit in first["hits"] + second["hits"]]
+        self.assertEqual(len(set(ids)), 5)
+
+    @gen_test
+    async def test_search_treats_syntax_as_text(self):
+        response, data = await self._search(q='NEAR( "unterminated * OR -')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(data["hits"], [])
+
+    @gen_test
+    async def test_search_without_query(self):
+        response, data = await self._search(q="  ")
+        self.assertEqual(response.code, 400)
+        self.assertEqual(data["error"], "Search query is required")
+
+    @gen_test
+    async def test_search_invalid_cursor(self):
+        response, data = await self._search(q="anything", after="!!")
+        self.assertEqual(response.code, 400)
+        self.assertEqual(data["error"], "Invalid cursor")
+
+    @gen_test
+    async def test_search_cursor_out_of_range(self):
+        for offset in (-1, MAX_SEARCH_OFFSET + 1):
+            response, data = await self._search(q="anything", after=encode_cursor(offset))
+            self.assertEqual(response.code, 400)
+            self.assertEqual(data["error"], "Invalid cursor")
+
+    def test_build_match_query(self):
+        self.assertEqual(build_match_query('slow "check out"'), '"slow" "check out"')
+        self.assertEqual(build_match_query('a"b'), '"a""b"')
@@ -0,0 +1,87 @@
+# test/serialization_tests.py
+import json
+import unittest
+
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application, HTTPError
+
+import app.service.serialization as serialization
+from app.handlers.base_auth_handler import BaseAuthHandler
+from app.service.serialization import encode_json, accepts_msgpack, negotiate, JSON_CONTENT_TYPE
+
+DATA = {"feedbacks": [{"id": 1, "note": "Café </script>", "rating": 4.5, "tags": None}], "next_cursor": None}
+
+
+class TestSerialization(unittest.TestCase):
+
+    def test_encode_json_round_trips(self):
+        self.assertEqual(json.loads(encode_json(DATA)), DATA)
+        self.assertEqual(json.loads(encode_json({1: "int key"})), {"1": "int key"})
+
+    def test_encode_json_without_orjson(self):
+        orjson, serialization.orjson = serialization.orjson, None
+        try:
+            self.assertEqual(json.loads(encode_json(DATA)), DATA)
+        finally:
+            serialization.orjson = orjson
+
+    def test_accepts_msgpack(self):
+        self.assertTrue(accepts_msgpack("application/msgpack"))
+        self.assertTrue(accepts_msgpack("application/json;q=0.5, application/x-msgpack"))
+        self.assertFalse(accepts_msgpack("application/msgpack;q=0"))
+        self.assertFalse(accepts_msgpack("application/json, */*"))
+        self.assertFalse(accepts_msgpack(None))
+
+    def test_negotiate_falls_back_to_json_without_msgpack(self):
+        msgpack, serialization.msgpack = serialization.msgpack, None
+        try:
+            self.assertEqual(negotiate("application/msgpack")[0], JSON_CONTENT_TYPE)
+        finally:
+            serialization.msgpack = msgpack
+
+
+class DataHandler(BaseAuthHandler):
+    load_user = False
+
+    def get(self):
+        self.write(DATA)
+
+
+class FailingHandler(BaseAuthHandler):
+    load_user = False
+
+    def get(self):
+        raise HTTPError(404, "Nothing here")
+
+
+class TestSerializationIntegration(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([
+            (r"/data", DataHandler),
+            (r"/error", FailingHandler),
+        ])
+
+    @gen_test
+    async def test_json_by_default(self):
+        response = await self.http_client.fetch(self.get_url("/data"))
+        self.assertEqual(response.headers["Content-Type"], JSON_CONTENT_TYPE)
+        self.assertEqual(json.loads(response.body), DATA)
+
+    @gen_test
+    async def test_errors_use_the_same_encoder(self):
+        response = await self.http_client.fetch(self.get_url("/error"), raise_error=False)
+        self.assertEqual(response.code, 404)
+        self.assertEqual(response.headers["Content-Type"], JSON_CONTENT_TYPE)
+        self.assertEqual(json.loads(response.body), {"error": "HTTP 404: Not Found (Nothing here)"})
+
+    @unittest.skipUnless(serialization.msgpack, "msgpack is not installed")
+    @gen_test
+    async def test_msgpack_when_accepted(self):
+        headers = {"Accept": "application/msgpack"}
+        response = await self.http_client.fetch(self.get_url("/data"), headers=headers)
+        self.assertEqual(response.headers["Content-Type"], "application/msgpack")
+        self.assertEqual(serialization.msgpack.unpackb(response.body), DATA)
+
+        response = await self.http_client.fetch(self.get_url("/error"), headers=headers, raise_error=False)
+        self.assertEqual(serialization.msgpack.unpackb(response.body), {"error": "HTTP 404: Not Found (Nothing here)"})
@@ -0,0 +1,150 @@
+# test/vote_buffer_tests.py
+import datetime
+import json
+from unittest import mock
+
+import jwt
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application
+
+from app.handlers.base_auth_handler import SECRET_KEY
+from app.handlers.feedback_notation_handler import FeedBackNotationHandler
+from app.models import User, Feedback, FeedbackNotation
+from app.service.notation_service import flush_votes
+from app.service.vote_buffer import vote_buffer
+from test.db_test_config import init_inmemory_db, close_inmemory_db
+
+
+class TestVoteBufferIntegration(AsyncHTTPTestCase):
+    user = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import asyncio
+        cls.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(cls.loop)
+        cls.loop.run_until_complete(init_inmemory_db())
+        cls.user = cls.loop.run_until_complete(
+            User.create(username="bufferuser", password="hashedpw")
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.run_until_complete(close_inmemory_db())
+        cls.loop.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(vote_buffer, "enabled", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(vote_buffer.done)  # nothing left over for the next test
+        self.addCleanup(vote_buffer.take)
+
+    def get_app(self):
+        return Application([
+            (r"/feedback/([0-9]+)/notations", FeedBackNotationHandler),
+        ])
+
+    def _generate_token(self, user):
+        payload = {
+            "sub": str(user.id),
+            "username": user.username,
+            "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        }
+        return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
+
+    async def _put(self, feedback_id, value, user=None):
+        return await self.http_client.fetch(
+            self.get_url(f"/feedback/{feedback_id}/notations"),
+            method="PUT",
+            body=json.dumps({"value": value}),
+            headers={"Authorization": f"Bearer {self._generate_token(user or self.user)}"},
+            raise_error=False
+        )
+
+    async def _summary(self, feedback_id):
+        response = await self.http_client.fetch(
+            self.get_url(f"/feedback/{feedback_id}/notations"),
+            headers={"Authorization": f"Bearer {self._generate_token(self.user)}"},
+        )
+        return json.loads(response.body)
+
+    @gen_test
+    async def test_toggles_are_buffered_and_coalesced(self):
+        feedback = await Feedback.create(user=self.user, note="Live event", rating=5)
+
+        codes = [(await self._put(feedback.id, value)).code for value in (1, -1, 1, -1)]
+
+        self.assertEqual(codes, [202, 202, 202, 202])
+        self.assertEqual(len(vote_buffer), 1)
+        self.assertFalse(await FeedbackNotation.filter(feedback_id=feedback.id).exists())
+        # the voter reads their own write before the flush
+        summary = await self._summary(feedback.id)
+        self.assertEqual((summary["negative_notations"], summary["user_notation"]), (1, -1))
+
+        await flush_votes()
+
+        self.assertEqual(await FeedbackNotation.filter(feedback_id=feedback.id).values_list("value", flat=True), [-1])
+        await feedback.refresh_from_db()
+        self.assertEqual((feedback.positive_count, feedback.negative_count), (0, 1))
+        self.assertEqual(await self._summary(feedback.id), summary)
+
+    @gen_test
+    async def test_flush_sums_the_votes_of_many_users(self):
+        feedback = await Feedback.create(user=self.user, note="Popular", rating=4)
+        voters = [await User.create(username=f"voter{i}", password="pw") for i in range(3)]
+        # voter0 already voted -1 before, the flush moves that vote
+        await FeedbackNotation.create(user=voters[0], feedback=feedback, value=-1)
+        await Feedback.filter(id=feedback.id).update(negative_count=1)
+
+        for voter in voters:
+            await self._put(feedback.id, 1, user=voter)
+        await flush_votes()
+
+        await feedback.refresh_from_db()
+        self.assertEqual((feedback.positive_count, feedback.negative_count), (3, 0))
+        self.assertEqual(len(vote_buffer), 0)
+
+    @gen_test
+    async def test_buffered_vote_on_missing_feedback(self):
+        response = await self._put(999999, 1)
+        self.assertEqual(response.code, 404)
+        self.assertEqual(len(vote_buffer), 0)
+
+    @gen_test
+    async def test_flush_drops_the_votes_of_deleted_users(self):
+        feedback = await Feedback.create(user=self.user, note="Deleted voter", rating=4)
+        voter = await User.create(username="deleted_voter", password="pw")
+        await self._put(feedback.id, 1, user=voter)
+        await self._put(feedback.id, 1)
+        await User.filter(id=voter.id).delete()  # no signal, like a delete made by another process
+
+        await flush_votes()  # fails on the deleted voter's vote
+        self.assertEqual(len(vote_buffer), 1)
+        await flush_votes()
+
+        self.assertEqual(len(vote_buffer), 0)
+        await feedback.refresh_from_db()
+        self.assertEqual(feedback.positive_count, 1)
+
+    @gen_test
+    async def test_direct_write_during_a_failed_flush_is_not_overwritten(self):
+        feedback = await Feedback.create(user=self.user, note="Raced", rating=3)
+        await self._put(feedback.id, 1)
+        vote_buffer.take()  # a flush starts with the buffered vote
+
+        response = await self.http_client.fetch(
+            self.get_url(f"/feedback/{feedback.id}/notations"),
+            method="POST",
+            body=json.dumps({"value": -1}),
+            headers={"Authorization": f"Bearer {self._generate_token(self.user)}"},
+        )
+        self.assertEqual(response.code, 201)
+        self.assertIsNone(vote_buffer.get(FeedbackNotation, self.user.id, feedback.id))
+
+        vote_buffer.done(failed=True)  # the flush fails, the superseded vote is not put back
+        self.assertEqual(len(vote_buffer), 0)
+        self.assertEqual((await self._summary(feedback.id))["user_notation"], -1)